@@ -14,6 +14,8 @@ from leancloud.errors import LeanCloudError
 
 from config import *
 from event_analyzer_lib import core, utils
+from event_analyzer_lib.algo.exception import UnknownSymbolError
+from event_analyzer_lib.session import StreamSessionError
 
 
 # Configure Logentries
@@ -41,6 +43,30 @@ app = Flask(__name__)
 handle_exceptions(app)
 
 
+# Readiness of this process, `/isAlive/` reports not ready until the preload finished
+Service_Status = {'ready': False, 'preloadSeconds': None, 'preloadFailed': []}
+
+
+def warm_up(targets, snapshots=(), pinned=False):
+    '''Load the tag snapshots, preload the classifiers of `targets`, then mark the service ready
+
+    Snapshots and targets that fail to load are logged and left to lazy loading, they don't block readiness.
+    '''
+    start = time.time()
+    failed = []
+    for path in snapshots:
+        try:
+            core.importTag(path, pinned)
+        except Exception, e:
+            logger.exception('[warm up] import snapshot %s failed: %s' % (path, e))
+            failed.append(path)
+    logger.info('[warm up] preload %s' % (targets,))
+    Service_Status['preloadFailed'] = failed + core.preload(targets)
+    Service_Status['preloadSeconds'] = time.time() - start
+    Service_Status['ready'] = True
+    logger.info('[warm up] ready after %.3fs' % (Service_Status['preloadSeconds']))
+
+
 @app.before_first_request
 def init_before_first_request():
     init_tag = "[Initiation of Service Process]\n"
@@ -65,7 +91,7 @@ def rebuild_event():
       e.g. {"event_type":"shopping#mall", "tag":"init_model"}
       event_type: string
       tag: string
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -126,7 +152,7 @@ def init_all():
     data: JSON Obj
       e.g. {}
       tag: string, optional, default 'init_model_timestamp'
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -135,7 +161,7 @@ def init_all():
       code: int
         0 success, 1 fail
       message: string
-      result:
+      result: dict, {"ids": {eventType: model id}, "failures": {eventType: error message}}
     '''
     if request.headers.has_key('X-Request-Id') and request.headers['X-Request-Id']:
         x_request_id = request.headers['X-Request-Id']
@@ -162,7 +188,13 @@ def init_all():
 
     logger.info('<%s>, [init all] valid request params: %s' % (x_request_id, incoming_data))
 
-    core.initAll(tag, algo_type)
+    outcome = core.initAll(tag, algo_type)
+    result['result'] = outcome
+    if outcome['failures']:
+        result['message'] = 'failed to save models of events: %s' % (', '.join(outcome['failures']))
+        result['code'] = 1
+        logger.error('<%s> [init all] %s' % (x_request_id, result['message']))
+        return json.dumps(result)
     result['message'] = 'success'
     result['code'] = 0
     logger.info('<%s> [init all] success' % (x_request_id))
@@ -182,7 +214,7 @@ def train_randomly():
       event_type: string
       sourceTag: string
       targetTag: string, optional, default "random_train"
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -249,7 +281,7 @@ def train_randomly_all():
       e.g. {"sourceTag":"init_model"}
       sourceTag: string
       targetTag: string, optional, default "random_train"
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -258,8 +290,7 @@ def train_randomly_all():
       code: int
         0 success, 1 fail
       message: string
-      result: dict, optional
-        model object id
+      result: dict, {"ids": {eventType: model id}, "failures": {eventType: error message}}
     '''
     if request.headers.has_key('X-Request-Id') and request.headers['X-Request-Id']:
         x_request_id = request.headers['X-Request-Id']
@@ -292,7 +323,13 @@ def train_randomly_all():
     obs_len   = incoming_data.get('obs_len', 10)
     obs_count = incoming_data.get('obs_count', 500)
 
-    core.trainAll(sourceTag, targetTag, obs_len, obs_count, algo_type)
+    outcome = core.trainAll(sourceTag, targetTag, obs_len, obs_count, algo_type)
+    result['result'] = outcome
+    if outcome['failures']:
+        result['message'] = 'failed to save models of events: %s' % (', '.join(outcome['failures']))
+        result['code'] = 1
+        logger.error('<%s> [train randomly all] %s' % (x_request_id, result['message']))
+        return json.dumps(result)
     result['code'] = 0
     result['message'] = 'success'
     logger.info('<%s> [train randomly all] success' % (x_request_id))
@@ -314,7 +351,7 @@ def predict():
            }
       seq: list
       tag: string
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -381,6 +418,221 @@ def predict():
         logger.info('<%s> [predict] [LeanCloudError] %s' % (x_request_id, err_msg))
         result['code'] = 103
         return make_response(json.dumps(result), 400)
+    except UnknownSymbolError, err_msg:
+        result['message'] = "[UnknownSymbolError] %s=%s is not a known status" % (err_msg.rawdataType, err_msg.symbol)
+        logger.info('<%s> [predict] [UnknownSymbolError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+
+    return json.dumps(result)
+
+
+@app.route('/predictStream/', methods=['POST'])
+def predict_stream():
+    '''Predict the growing seq of a session belong to which event
+
+    Only the senz items appended since the previous request of the session are sent,
+    the result equals `/predict/` of the whole seq so far.
+
+    Sessions are kept by the worker which scored them, a follow-up request served by another
+    worker, or after the session expired, gets 409 with the `seqLength` that worker holds
+    (0 if none), the client then resends the items after it, or the whole seq with reset.
+
+    Parameters
+    ----------
+    data: JSON obj
+      e.g. {
+            "session_id": "user_1_20150801",
+            "seq" : [{"motion": "sitting", "sound": "unknown", "location": "chinese_restaurant"},
+                     {"motion": "walking", "sound": "shop", "location": "night_club"}],
+            "tag":"randomTrain",
+            "offset": 3
+           }
+      session_id: string
+      seq: list, new senz items of the session
+      tag: string
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
+      reset: bool, optional, default false, start the session over
+      offset: int, optional, default 0, items of the session sent before this request,
+        i.e. the `seqLength` of the previous response, 0 starts the session over
+
+    Returns
+    -------
+    result: JSON Obj
+      e.g. {"code":0, "message":"success", "result":{"shopping":0.7,"walking":0.3}, "seqLength": 5}
+      code: int
+        0 success, 1 fail, 104 session lost or out of sync
+      message: string
+      result: dict
+      seqLength: int, length of the whole seq of the session so far
+    '''
+    if request.headers.has_key('X-Request-Id') and request.headers['X-Request-Id']:
+        x_request_id = request.headers['X-Request-Id']
+    else:
+        x_request_id = ''
+
+    logger.info('<%s>, [predict stream] enter, request ip:%s, ua:%s' %(x_request_id, request.remote_addr, request.remote_user))
+    result = {'code': 1, 'message': ''}
+
+    # params JSON validate
+    try:
+        incoming_data = json.loads(request.data)
+    except ValueError, err_msg:
+        logger.exception('<%s>, [predict stream] [ValueError] err_msg: %s, params=%s' % (x_request_id, err_msg, request.data))
+        result['message'] = 'Unvalid params: NOT a JSON Object'
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+
+    # params key checking
+    for key in ['session_id', 'seq', 'tag']:
+        if key not in incoming_data:
+            logger.exception("<%s>, [predict stream] [KeyError] params=%s, should have key: %s" % (x_request_id, incoming_data, key))
+            result['message'] = "Params content Error: cant't find key=%s" % (key)
+            result['code'] = 103
+            return make_response(json.dumps(result), 400)
+
+    session_id = incoming_data['session_id']
+    seq = incoming_data['seq']
+    tag = incoming_data['tag']
+    algo_type = incoming_data.get('algo_type', "GMMHMM")
+    reset = incoming_data.get('reset', False)
+    offset = incoming_data.get('offset', 0)
+
+    if not seq:
+        result['code'] = 103
+        result['message'] = 'input params [seq=NULL]'
+        logger.info('<%s>, [predict stream] request params `seq`=NULL' % (x_request_id))
+        return json.dumps(result)
+
+    logger.info('<%s>, [predict stream] valid request params session_id=%s, seq=%s, tag=%s, algo_type=%s, reset=%s, offset=%s'
+                % (x_request_id, session_id, seq, tag, algo_type, reset, offset))
+
+    try:
+        # data clean for seq
+        seq_cleaned = []
+        for elem in seq:
+            seq_cleaned.append({
+                'location': elem['location'],
+                'motion': elem['motion'],
+                'sound': elem['sound'],
+            })
+
+        result['result'], result['seqLength'] = core.predictEventStream(session_id, seq_cleaned, tag, algo_type,
+                                                                        reset=reset, offset=offset,
+                                                                        x_request_id=x_request_id)
+        result['code'] = 0
+        result['message'] = 'success'
+        logger.info('<%s> [predict stream] success, predict result=%s' %(x_request_id, result['result']))
+    except LeanCloudError, err_msg:
+        result['message'] = "[LeanCloudError] Maybe can't find tag=%s" % (tag)
+        logger.info('<%s> [predict stream] [LeanCloudError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+    except UnknownSymbolError, err_msg:
+        result['message'] = "[UnknownSymbolError] %s=%s is not a known status" % (err_msg.rawdataType, err_msg.symbol)
+        logger.info('<%s> [predict stream] [UnknownSymbolError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+    except StreamSessionError, err_msg:
+        result['message'] = "[StreamSessionError] session lost or out of sync, resend the seq after seqLength=%s, or the whole seq with reset" % (err_msg.seq_length)
+        result['seqLength'] = err_msg.seq_length
+        logger.info('<%s> [predict stream] [StreamSessionError] %s' % (x_request_id, err_msg))
+        result['code'] = 104
+        return make_response(json.dumps(result), 409)
+
+    return json.dumps(result)
+
+
+@app.route('/predictBatch/', methods=['POST'])
+def predict_batch():
+    '''Predict each seq of seqs belong to which event
+
+    Parameters
+    ----------
+    data: JSON obj
+      e.g. {
+            "seqs" : [[{"motion": "sitting", "sound": "unknown", "location": "chinese_restaurant"},
+                       {"motion": "sitting", "sound": "shop", "location": "chinese_restaurant"}],
+                      [{"motion": "walking", "sound": "shop", "location": "night_club"}]],
+            "tag":"randomTrain"
+           }
+      seqs: list, must be 2-dimension list
+      tag: string
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
+
+    Returns
+    -------
+    result: JSON Obj
+      e.g. {"code":0, "message":"success", "result":[{"shopping":0.7,"walking":0.3}, {"shopping":0.1,"walking":0.9}]}
+      code: int
+        0 success, 1 fail
+      message: string
+      result: list of dict, same order as `seqs`
+    '''
+    if request.headers.has_key('X-Request-Id') and request.headers['X-Request-Id']:
+        x_request_id = request.headers['X-Request-Id']
+    else:
+        x_request_id = ''
+
+    logger.info('<%s>, [predict batch] enter, request ip:%s, ua:%s' %(x_request_id, request.remote_addr, request.remote_user))
+    result = {'code': 1, 'message': ''}
+
+    # params JSON validate
+    try:
+        incoming_data = json.loads(request.data)
+    except ValueError, err_msg:
+        logger.exception('<%s>, [predict batch] [ValueError] err_msg: %s, params=%s' % (x_request_id, err_msg, request.data))
+        result['message'] = 'Unvalid params: NOT a JSON Object'
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+
+    # params key checking
+    for key in ['seqs', 'tag']:
+        if key not in incoming_data:
+            logger.exception("<%s>, [predict batch] [KeyError] params=%s, should have key: %s" % (x_request_id, incoming_data, key))
+            result['message'] = "Params content Error: cant't find key=%s" % (key)
+            result['code'] = 103
+            return make_response(json.dumps(result), 400)
+
+    seqs = incoming_data['seqs']
+    tag = incoming_data['tag']
+    algo_type = incoming_data.get('algo_type', "GMMHMM")
+
+    if not utils.check_2D_list(seqs) or not all(seqs):
+        result['code'] = 103
+        result['message'] = 'input seqs=%s is not 2-dimension or has NULL seq' % (seqs)
+        logger.info('<%s>, [predict batch] request params `seqs` unvalid' % (x_request_id))
+        return json.dumps(result)
+
+    logger.info('<%s>, [predict batch] valid request params seqs count=%s, tag=%s, algo_type=%s' % (x_request_id, len(seqs), tag, algo_type))
+
+    try:
+        # data clean for seqs
+        seqs_cleaned = []
+        for seq in seqs:
+            seq_cleaned = []
+            for elem in seq:
+                seq_cleaned.append({
+                    'location': elem['location'],
+                    'motion': elem['motion'],
+                    'sound': elem['sound'],
+                })
+            seqs_cleaned.append(seq_cleaned)
+
+        result['result'] = core.predictEvents(seqs_cleaned, tag, algo_type, x_request_id)
+        result['code'] = 0
+        result['message'] = 'success'
+        logger.info('<%s> [predict batch] success, predict results count=%s' %(x_request_id, len(result['result'])))
+    except LeanCloudError, err_msg:
+        result['message'] = "[LeanCloudError] Maybe can't find tag=%s" % (tag)
+        logger.info('<%s> [predict batch] [LeanCloudError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
+    except UnknownSymbolError, err_msg:
+        result['message'] = "[UnknownSymbolError] %s=%s is not a known status" % (err_msg.rawdataType, err_msg.symbol)
+        logger.info('<%s> [predict batch] [UnknownSymbolError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
 
     return json.dumps(result)
 
@@ -405,7 +657,7 @@ def train():
       event_type: string
       sourceTag: string
       targetTag: string, optional, default equal to `sourceTag`
-      algo_type: string, optional, default "GMMHMM"
+      algo_type: string, optional, default "GMMHMM", or "DiscreteHMM"
 
     Returns
     -------
@@ -477,6 +729,11 @@ def train():
         logger.info('<%s> [train] [LeanCloudError] %s' % (x_request_id, err_msg))
         result['code'] = 103
         return make_response(json.dumps(result), 400)
+    except UnknownSymbolError, err_msg:
+        result['message'] = "[UnknownSymbolError] %s=%s is not a known status" % (err_msg.rawdataType, err_msg.symbol)
+        logger.info('<%s> [train] [UnknownSymbolError] %s' % (x_request_id, err_msg))
+        result['code'] = 103
+        return make_response(json.dumps(result), 400)
 
     return json.dumps(result)
 
@@ -492,7 +749,13 @@ def is_alive():
 
     logger.info('<%s>, [isAlive] request from ip:%s, ua:%s' %(x_request_id, request.remote_addr,
                                                                        request.remote_user))
-    result = {'code': 0, 'message': 'Alive'}
+    if not Service_Status['ready']:
+        result = {'code': 1, 'message': 'Warming up'}
+        return make_response(json.dumps(result), 503)
+
+    result = {'code': 0, 'message': 'Alive', 'preloadSeconds': Service_Status['preloadSeconds'],
+              'preloadFailed': Service_Status['preloadFailed'], 'modelLoads': core.getModelLoadStats(),
+              'predictCache': core.getPredictCacheStats()}
     return json.dumps(result)
 
 
@@ -1,6 +1,7 @@
 __author__ = 'jiaying.lu'
 
-__all__ = ['APP_ID', 'MASTER_KEY', 'APP_ENV', 'LOGENTRIES_TOKEN', 'BUGSNAG_TOKEN']
+__all__ = ['APP_ID', 'MASTER_KEY', 'APP_ENV', 'LOGENTRIES_TOKEN', 'BUGSNAG_TOKEN', 'PRELOAD_TARGETS', 'PRELOAD_IN_MASTER',
+           'SNAPSHOT_FILES', 'SNAPSHOT_PINNED']
 
 import os
 
@@ -66,3 +67,27 @@ elif APP_ENV == 'local':
     BUGSNAG_TOKEN = PROD_BUGSNAG_TOKEN
 else:
     raise ValueError('Unvalid APP_ENV: %s' %(APP_ENV))
+
+# Models to warm up when the service boots
+# PRELOAD_TAGS is a comma separated list of `algo_type:tag` or `tag` (algo_type defaults to GMMHMM),
+#   e.g. PRELOAD_TAGS="GMMHMM:init_model,random_train"
+# PRELOAD_IN_MASTER=1 preloads once at import, run gunicorn with --preload so forked workers share it,
+#   otherwise every worker preloads in a greenlet after boot
+PRELOAD_TARGETS = []
+for target in os.environ.get('PRELOAD_TAGS', '').split(','):
+    target = target.strip()
+    if not target:
+        continue
+    if ':' in target:
+        algo_type, tag = target.split(':', 1)
+    else:
+        algo_type, tag = 'GMMHMM', target
+    PRELOAD_TARGETS.append((algo_type, tag))
+PRELOAD_IN_MASTER = os.environ.get('PRELOAD_IN_MASTER') == '1'
+
+# Tag snapshots (written by tag_snapshot.py export) to load before the preload, no query is needed
+# SNAPSHOT_FILES is a comma separated list of paths, e.g. SNAPSHOT_FILES="/data/GMMHMM-random_train.snap"
+# SNAPSHOT_PINNED=1 keeps serving the snapshots without checking the database for newer models,
+# pinned tags are never evicted from the model caches and are kept on top of their MODEL_CACHE_MAX_TAGS bound
+SNAPSHOT_FILES = [path.strip() for path in os.environ.get('SNAPSHOT_FILES', '').split(',') if path.strip()]
+SNAPSHOT_PINNED = os.environ.get('SNAPSHOT_PINNED') == '1'
@@ -0,0 +1,83 @@
+'''Benchmark of DiscreteHMM against GMMHMM on random observations
+
+Both algos are trained on the same `Dataset.randomObservations` of every event and
+classify the same held-out random seqs, a seq is counted correct when its own event
+scores the highest log probability.
+
+    $ cd event_analyzer_lib/algo && python benchmark.py
+'''
+
+import random
+import time
+import numpy as np
+from datasets import Dataset
+from trainer import GMMHMMTrainer, DiscreteHMMTrainer
+from classifier import GMMHMMClassifier, DiscreteHMMClassifier
+
+EVENTS = ['dining_in_restaurant', 'shopping_in_mall', 'work_in_office', 'exercise_outdoor',
+          'study_in_class', 'watch_movie']
+
+
+def _gmmhmmParams(covariance_type, n_component=4, n_mix=4):
+    transmat = [[1.0 / n_component] * n_component for _ in range(n_component)]
+    startprob = [1.0 / n_component] * n_component
+    return {
+        'nIter': 20,
+        'hmmParams': {'nComponent': n_component, 'transMat': transmat, 'transMatPrior': transmat,
+                      'startProb': startprob, 'startProbPrior': startprob},
+        'gmmParams': {'nMix': n_mix, 'covarianceType': covariance_type},
+    }
+
+
+def compareAlgos(events=EVENTS, train_len=10, train_count=50, test_len=10, test_count=50,
+                 covariance_types=('full', 'diag'), seed=1):
+    '''Train & evaluate DiscreteHMM and GMMHMM of every covariance type on the same random data
+
+    Returns
+    -------
+    rows: list of dict
+      {'algo': string, 'fitSeconds': float, 'predictMs': float per seq, 'accuracy': float}
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    d = Dataset()
+    status_set = {'motion': list(d.motion_type), 'sound': list(d.sound_type), 'location': list(d.location_type)}
+    train_sets = {}
+    test_seqs = []
+    for event in events:
+        train_sets[event] = d.randomObservations(event, train_len, train_count).getDataset()
+        test_seqs += [(event, d.randomSequence(event, test_len)) for _ in range(test_count)]
+
+    candidates = [('DiscreteHMM', DiscreteHMMTrainer, DiscreteHMMClassifier,
+                   DiscreteHMMTrainer.defaultParams(status_set))]
+    for covariance_type in covariance_types:
+        candidates.append(('GMMHMM(%s)' % covariance_type, GMMHMMTrainer, GMMHMMClassifier,
+                           _gmmhmmParams(covariance_type)))
+
+    rows = []
+    for name, TRAINER, CLASSIFIER, init_params in candidates:
+        models = {}
+        start = time.time()
+        for event in events:
+            my_trainer = TRAINER(init_params)
+            my_trainer.fit(train_sets[event])
+            models[event] = {'status_set': status_set, 'param': my_trainer.params_}
+        fit_seconds = time.time() - start
+
+        my_classifier = CLASSIFIER(models)
+        correct = 0
+        start = time.time()
+        for event, seq in test_seqs:
+            result = my_classifier.predict(seq)
+            if max(result, key=result.get) == event:
+                correct += 1
+        predict_ms = (time.time() - start) * 1e3 / len(test_seqs)
+        rows.append({'algo': name, 'fitSeconds': fit_seconds, 'predictMs': predict_ms,
+                     'accuracy': float(correct) / len(test_seqs)})
+    return rows
+
+
+if __name__ == '__main__':
+    print('%-18s %10s %12s %10s' % ('algo', 'fit (s)', 'predict (ms)', 'accuracy'))
+    for row in compareAlgos():
+        print('%-18s %10.2f %12.3f %10.3f' % (row['algo'], row['fitSeconds'], row['predictMs'], row['accuracy']))
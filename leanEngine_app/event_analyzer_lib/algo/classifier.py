@@ -1,6 +1,7 @@
 from hmmlearn.hmm import GMMHMM
-from datasets import Dataset
+from datasets import Dataset, getCodec, statusSetFingerprint, CODEC_CACHE_MAX
 from sklearn.mixture.gmm import GMM
+from scorer import GMMHMMScorer, DiscreteHMMScorer, HMMLearnScorer, StackedHMMScorer, UnstackedScorer
 import numpy as np
 import logging
 
@@ -83,71 +84,232 @@ class BaseClassifier(object):
 
 
 
-class GMMHMMClassifier(BaseClassifier):
-    '''A wrapper to a set of GMMHMMs for predict
+class HMMClassifier(BaseClassifier):
+    '''A wrapper to a set of HMM scorers for predict, one per label
+
+    Subclasses set `SCORER`, a scorer class built from a label's params.
+    Labels sharing a status set and the shape of their models are stacked into
+    one StackedHMMScorer, so a predict costs one emission pass and one forward
+    recursion per pack instead of per label.
 
     Attributes
     ----------
     _models: list of dict
       init models params
-    gmmhmms: dict
-      keys are labels of GMMHMMs, values are dict {'gmmhmm': instance, 'status_set':status_set}
+    hmms: dict
+      keys are labels, values are dict {'status_set':status_set, 'fingerprint':fingerprint, 'pack': index, 'event': index}
+    packs: list of dict
+      {'labels': list, 'fingerprint': fingerprint, 'status_set': status_set, 'scorer': StackedHMMScorer or UnstackedScorer},
+      the i-th label of a pack is the i-th event of its scorer
+    codecs: dict
+      keys are fingerprints of status sets, values are shared Dataset instances to encode seq
+    max_codecs: int, codecs shared by the classifiers of this process, see datasets.getCodec
     predict_data_: current predict_data
     '''
 
-    def __init__(self, _models):
-        super(GMMHMMClassifier, self).__init__(_models)
-        self.gmmhmms = {}
+    SCORER = None
+
+    def __init__(self, _models, max_codecs=CODEC_CACHE_MAX):
+        super(HMMClassifier, self).__init__(_models)
+        self.max_codecs = max_codecs
+        self.hmms = {}
+        self.packs = []
+        self.codecs = {}
         self.predict_data_ = None
 
-        for label, value in _models.iteritems():
-            _model = value['param']
-            hmm_params = _model['hmmParams']
-            gmm_params = _model['gmmParams']
-            n_iter = _model.get('nIter', 50)
-
-            transmat = np.array(hmm_params['transMat'])
-            transmat_prior = np.array(hmm_params['transMatPrior'])
-            n_component = hmm_params['nComponent']
-            startprob = np.array(hmm_params['startProb'])
-            startprob_prior = np.array(hmm_params['startProbPrior'])
-
-            n_mix = gmm_params['nMix']
-            covariance_type = gmm_params['covarianceType']
-            gmms = gmm_params.get('gmms', None)
-
-            gmm_obj_list = []
-            if not gmms:
-                gmm_obj_list = None
-            else:
-                for gmm in gmms:
-                    gmm_obj = GMM(n_components=gmm['nComponent'], covariance_type=gmm['covarianceType'])
-                    gmm_obj.covars_ = np.array(gmm['covars'])
-                    gmm_obj.means_ = np.array(gmm['means'])
-                    gmm_obj.weights_ = np.array(gmm['weights'])
-                    gmm_obj_list.append(gmm_obj)
-
-            gmmhmm = GMMHMM(n_components=n_component, n_mix=n_mix, gmms=gmm_obj_list,
-                            n_iter=n_iter, covariance_type=covariance_type,
-                            transmat=transmat, transmat_prior=transmat_prior,
-                            startprob=startprob, startprob_prior=startprob_prior)
-            self.gmmhmms[label] = {'gmmhmm': gmmhmm, 'status_set': value['status_set']}
+        groups = {}
+        for label in sorted(_models):
+            value = _models[label]
+            scorer = self._buildScorer(value['param'])
+            fingerprint = statusSetFingerprint(value['status_set'])
+            stack_key = StackedHMMScorer.stackKey(scorer)
+            if stack_key is None:
+                self._addPack([label], value['status_set'], UnstackedScorer(scorer))
+                continue
+            group = groups.setdefault((fingerprint, stack_key), {'labels': [], 'scorers': [],
+                                                                 'status_set': value['status_set']})
+            group['labels'].append(label)
+            group['scorers'].append(scorer)
+        for key in sorted(groups):
+            group = groups[key]
+            self._addPack(group['labels'], group['status_set'], StackedHMMScorer(group['scorers']))
+
+    def _buildScorer(self, _model):
+        return self.SCORER(_model)
+
+    def _addPack(self, labels, status_set, scorer):
+        fingerprint = statusSetFingerprint(status_set)
+        self.codecs[fingerprint] = getCodec(status_set, self.max_codecs)
+        for event, label in enumerate(labels):
+            self.hmms[label] = {'status_set': status_set, 'fingerprint': fingerprint,
+                                'pack': len(self.packs), 'event': event}
+        self.packs.append({'labels': labels, 'fingerprint': fingerprint, 'status_set': status_set, 'scorer': scorer})
+
+    def pack(self):
+        '''Flatten every pack's stacked scorer for the param store
+
+        Returns
+        -------
+        items: list of dict {'meta', 'arrays'}
+        '''
+        items = []
+        for pack in self.packs:
+            meta, arrays = pack['scorer'].pack()
+            items.append({'meta': {'labels': pack['labels'], 'statusSet': pack['status_set'], 'scorer': meta},
+                          'arrays': arrays})
+        return items
+
+    @classmethod
+    def from_packed(cls, items, max_codecs=CODEC_CACHE_MAX):
+        '''Build a classifier from `pack` output, e.g. arrays mapped from the param store
+        '''
+        classifier = cls({}, max_codecs=max_codecs)
+        for item in items:
+            meta = item['meta']
+            classifier._addPack(meta['labels'], meta['statusSet'], StackedHMMScorer.unpack(meta['scorer'], item['arrays']))
+        return classifier
 
     def __repr__(self):
-        return '<GMMHMMClassifer instance>\n\tinit_models:%s\n\ttrain_data:%s' % (self._models, self.predict_data_)
+        return '<%s instance>\n\tinit_models:%s\n\ttrain_data:%s' % (self.__class__.__name__, self._models,
+                                                                      self.predict_data_)
+
+    def encode(self, seq):
+        '''Encode seq once per distinct status set
+
+        Returns
+        -------
+        seqs_converted: dict
+          keys are fingerprints of status sets, values are numerical seq arrays
+        '''
+        seqs_converted = {}
+        for fingerprint, codec in self.codecs.iteritems():
+            seqs_converted[fingerprint] = np.array(codec._convetNumericalSequence(seq))
+        return seqs_converted
 
     def predict(self, seq):
-        result = {}
         self.predict_data_ = seq
-        for label, value in self.gmmhmms.iteritems():
-            gmmhmm = value['gmmhmm']
-            status_set = value['status_set']
-            d = Dataset(motion_type=status_set['motion'], sound_type=status_set['sound'],
-                        location_type=status_set['location'])
-            seq_converted = np.array(d._convetNumericalSequence(seq))
-            result[label] = gmmhmm.score(seq_converted)
+        return self.predict_encoded(self.encode(seq))
+
+    def predict_encoded(self, seqs_converted):
+        '''Score a seq already converted by `encode`
+        '''
+        result = {}
+        for pack in self.packs:
+            logprobs = pack['scorer'].score(seqs_converted[pack['fingerprint']])
+            for label, logprob in zip(pack['labels'], logprobs):
+                result[label] = logprob
         return result
 
+    def predict_stream(self, seq, states=None):
+        '''Score seq as the continuation of a seq already scored
+
+        Parameters
+        ----------
+        seq: list, the new senz items only
+        states: dict, returned by the previous call, None starts a new seq
+
+        Returns
+        -------
+        result: dict, same as `predict` of the whole seq so far
+        states: dict, keys are labels, values are forward states to carry on
+        '''
+        result = {}
+        new_states = {}
+        self.predict_data_ = seq
+        seqs_converted = self.encode(seq)
+        for pack in self.packs:
+            scorer = pack['scorer']
+            framelogprob = scorer.framelogprob(seqs_converted[pack['fingerprint']])
+            state = None
+            if states:
+                label_states = [states[label] for label in pack['labels']]
+                state = (np.array([alpha for alpha, _ in label_states]),
+                         np.array([logprob for _, logprob in label_states]))
+            alphas, logprobs = scorer.forward_state(framelogprob, state)
+            for event, label in enumerate(pack['labels']):
+                new_states[label] = (alphas[event], logprobs[event])
+                result[label] = logprobs[event]
+        return result, new_states
+
+    def predict_batch(self, seqs):
+        '''Score a list of seqs, return one result dict per seq
+
+        Sequences are stacked, so every pack evaluates its emission densities
+        once for all frames, then runs the forward pass on each seq's slice.
+        '''
+        results = [{} for _ in seqs]
+        self.predict_data_ = seqs
+        stacked = self.encode([senz for seq in seqs for senz in seq])
+        lengths = [len(seq) for seq in seqs]
+        for pack in self.packs:
+            logprobs = pack['scorer'].score_batch(stacked[pack['fingerprint']], lengths)
+            for i, seq_logprobs in enumerate(logprobs):
+                for label, logprob in zip(pack['labels'], seq_logprobs):
+                    results[i][label] = logprob
+        return results
+
+
+class GMMHMMClassifier(HMMClassifier):
+    '''A wrapper to a set of GMMHMMs for predict
+
+    Attributes
+    ----------
+    engine: string
+      'numpy' scores with GMMHMMScorer, 'hmmlearn' scores with hmmlearn GMMHMM instances
+    gmmhmms: dict, same as `hmms`
+    '''
+
+    SCORER = GMMHMMScorer
+
+    def __init__(self, _models, engine='numpy', max_codecs=CODEC_CACHE_MAX):
+        self.engine = engine
+        super(GMMHMMClassifier, self).__init__(_models, max_codecs)
+        self.gmmhmms = self.hmms
+
+    def _buildScorer(self, _model):
+        if self.engine == 'numpy':
+            return GMMHMMScorer(_model)
+        return HMMLearnScorer(self._buildGMMHMM(_model))
+
+    @staticmethod
+    def _buildGMMHMM(_model):
+        hmm_params = _model['hmmParams']
+        gmm_params = _model['gmmParams']
+        n_iter = _model.get('nIter', 50)
+
+        transmat = np.array(hmm_params['transMat'], dtype=float)
+        transmat_prior = np.array(hmm_params['transMatPrior'], dtype=float)
+        n_component = hmm_params['nComponent']
+        startprob = np.array(hmm_params['startProb'], dtype=float)
+        startprob_prior = np.array(hmm_params['startProbPrior'], dtype=float)
+
+        n_mix = gmm_params['nMix']
+        covariance_type = gmm_params['covarianceType']
+        gmms = gmm_params.get('gmms', None)
+
+        gmm_obj_list = []
+        if not gmms:
+            gmm_obj_list = None
+        else:
+            for gmm in gmms:
+                gmm_obj = GMM(n_components=gmm['nComponent'], covariance_type=gmm['covarianceType'])
+                gmm_obj.covars_ = np.array(gmm['covars'], dtype=float)
+                gmm_obj.means_ = np.array(gmm['means'], dtype=float)
+                gmm_obj.weights_ = np.array(gmm['weights'], dtype=float)
+                gmm_obj_list.append(gmm_obj)
+
+        return GMMHMM(n_components=n_component, n_mix=n_mix, gmms=gmm_obj_list,
+                      n_iter=n_iter, covariance_type=covariance_type,
+                      transmat=transmat, transmat_prior=transmat_prior,
+                      startprob=startprob, startprob_prior=startprob_prior)
+
+
+class DiscreteHMMClassifier(HMMClassifier):
+    '''A wrapper to a set of DiscreteHMMs for predict, scored by table lookups
+    '''
+
+    SCORER = DiscreteHMMScorer
+
 
 # if __name__ == "__main__":
 #     seq = [{"motion": "sitting", "sound": "tableware", "location": "chinese_restaurant"}, {"motion": "sitting", "sound": "talking", "location": "chinese_restaurant"}, {"motion": "walking", "sound": "talking", "location": "night_club"}, {"motion": "walking", "sound": "tableware", "location": "chinese_restaurant"}, {"motion": "sitting", "sound": "talking", "location": "night_club"}, {"motion": "sitting", "sound": "laugh", "location": "night_club"}, {"motion": "sitting", "sound": "talking", "location": "night_club"}, {"motion": "walking", "sound": "silence", "location": "chinese_restaurant"}, {"motion": "walking", "sound": "laugh", "location": "chinese_restaurant"}, {"motion": "sitting", "sound": "laugh", "location": "chinese_restaurant"}]
@@ -1,11 +1,31 @@
 import numpy as np
 import utils as ut
-import numpy as np
+from collections import OrderedDict
+from exception import UnknownSymbolError
 
 
 # import matplotlib.pyplot as plt
 
 
+class SymbolIndex(dict):
+    """
+    Symbol Index
+
+    Read-only map from status symbol to its index in a vocabulary.
+    When a symbol appears more than once, the first index is kept, as list.index() does.
+    """
+    def __init__(self, vocabulary):
+        dict.__init__(self)
+        for index, symbol in enumerate(vocabulary):
+            if symbol not in self:
+                dict.__setitem__(self, symbol, index)
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("SymbolIndex is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
 class Dataset(object):
     """
     Dataset
@@ -447,6 +467,13 @@ class Dataset(object):
             "location": self.location_type
         }
 
+        # symbol to index maps used by every encoder
+        self.motion_index = SymbolIndex(self.motion_type)
+        self.sound_index = SymbolIndex(self.sound_type)
+        self.location_index = SymbolIndex(self.location_type)
+        if self.location_one_type != None:
+            self.location_one_index = SymbolIndex(self.location_one_type)
+
     def _find_location_one(self, location_type_two):
         # this is inefficient, but this is training process,so we can omit this timedealy
         for key,values in self.location_map.items():
@@ -456,18 +483,16 @@ class Dataset(object):
 
     def convert_binary_sequence(self,obs):
 
-        def senz_2_index(senz):
-
-            assert self.location_one_type != None , \
-                "RNNRBM algo must set the right location_one set,but now location_one_type is none"
-
-            return [
-                self.motion_type.index(senz["motion"]),
-                self.location_type.index(senz["location"]),
-                self.location_one_type.index(senz["location_one"]),
-                self.sound_type.index(senz["sound"])
+        assert self.location_one_type != None , \
+            "RNNRBM algo must set the right location_one set,but now location_one_type is none"
 
-            ]
+        def senz_2_index(senz):
+            spot = self._senz2Spot(senz)
+            try:
+                location_one = self.location_one_index[senz["location_one"]]
+            except KeyError:
+                raise UnknownSymbolError("location_one", senz["location_one"])
+            return [spot[0], spot[1], location_one, spot[2]]
 
         def index_2_binary(indexs):
 
@@ -499,6 +524,27 @@ class Dataset(object):
         return np.array(self.binary_obs)
 
 
+    def _senz2Spot(self, senz):
+        """
+        Senz to Spot
+
+        Encode a senz as [motion, location, sound] indexes.
+        Raise UnknownSymbolError if any status is not in the vocabulary.
+        """
+        try:
+            return [
+                self.motion_index[senz["motion"]],
+                self.location_index[senz["location"]],
+                self.sound_index[senz["sound"]]
+            ]
+        except KeyError:
+            for rawdata_type, index in (("motion", self.motion_index),
+                                        ("location", self.location_index),
+                                        ("sound", self.sound_index)):
+                if senz[rawdata_type] not in index:
+                    raise UnknownSymbolError(rawdata_type, senz[rawdata_type])
+            raise
+
     def _convertNumericalObservation(self, obs):
         """
         Convert Numerical Observation
@@ -510,12 +556,7 @@ class Dataset(object):
         for seq in obs:
             spots_set = []
             for senz in seq:
-                spot = [
-                    self.motion_type.index(senz["motion"]),
-                    self.location_type.index(senz["location"]),
-                    self.sound_type.index(senz["sound"])
-                ]
-                spots_set.append(spot)
+                spots_set.append(self._senz2Spot(senz))
             numerical_obs.append(spots_set)
         return numerical_obs
 
@@ -525,15 +566,7 @@ class Dataset(object):
 
         Convert Sequence from Object to numercial python array (ie. list)
         """
-        numerical_seq = []
-        for senz in seq:
-            spot = [
-                self.motion_type.index(senz["motion"]),
-                self.location_type.index(senz["location"]),
-                self.sound_type.index(senz["sound"])
-            ]
-            numerical_seq.append(spot)
-        return numerical_seq
+        return [self._senz2Spot(senz) for senz in seq]
 
     # Generate fitable dataset
     def _convertObs2Dataset(self, obs):
@@ -549,12 +582,7 @@ class Dataset(object):
         for seq in obs:
             spots_set = []
             for senz in seq:
-                spot = [
-                    self.motion_type.index(senz["motion"]),
-                    self.location_type.index(senz["location"]),
-                    self.sound_type.index(senz["sound"])
-                ]
-                spots_set.append(spot)
+                spots_set.append(self._senz2Spot(senz))
             dataset.append(np.array(spots_set))
         return dataset
 
@@ -647,6 +675,41 @@ class Dataset(object):
         self.obs = obs
         return self
 
+# Store shared codecs in memory, keys are fingerprints of status sets, least recently used first
+Codec_In_Memory = OrderedDict()
+# Codecs kept by default, see getCodec
+CODEC_CACHE_MAX = 64
+
+
+def statusSetFingerprint(status_set):
+    """
+    Status Set Fingerprint
+
+    Return a hashable fingerprint of the (motion, sound, location) vocabularies in status_set.
+    Status sets with equal fingerprints encode every senz identically.
+    """
+    return tuple(tuple(status_set[rawdata_type]) for rawdata_type in ("motion", "sound", "location"))
+
+
+def getCodec(status_set, max_codecs=CODEC_CACHE_MAX):
+    """
+    Get Codec
+
+    Return the Dataset shared by every model whose status_set has the same fingerprint,
+    it is only used to encode sequences.
+    At most max_codecs are kept, least recently used are evicted first.
+    """
+    fingerprint = statusSetFingerprint(status_set)
+    codec = Codec_In_Memory.pop(fingerprint, None)
+    if codec is None:
+        codec = Dataset(motion_type=status_set["motion"], sound_type=status_set["sound"],
+                        location_type=status_set["location"])
+    Codec_In_Memory[fingerprint] = codec
+    while len(Codec_In_Memory) > max_codecs:
+        Codec_In_Memory.popitem(last=False)
+    return codec
+
+
 if __name__ == "__main__":
     dataset = Dataset()
     dataset.randomObservations("exercise_outdoor", 10, 1)
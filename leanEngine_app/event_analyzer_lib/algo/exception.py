@@ -1,6 +1,7 @@
 from utils import getTracebackInfo
 
-__all__ = ["FittingError", "ModelParamKeyError", "ModelInitError", "PredictingError", "CovarianceTypeError"]
+__all__ = ["FittingError", "ModelParamKeyError", "ModelInitError", "PredictingError", "CovarianceTypeError",
+           "UnknownSymbolError"]
 
 class PoiMiddlewareError(Exception):
     def __init__(self):
@@ -61,3 +62,13 @@ class ModelInitError(PoiMiddlewareError):
     def __str__(self):
         return "<%s> caused some errors occurred when gmm init, nComponent: %s, CovarianceType: %s, nIter: %s\n Traceback: %s" % \
                (self.__class__.__name__, self.nComponent, self.covarianceType, self.nIter, self.traceback)
+
+class UnknownSymbolError(PoiMiddlewareError, ValueError):
+    def __init__(self, rawdata_type, symbol):
+        PoiMiddlewareError.__init__(self)
+        self.rawdataType = rawdata_type
+        self.symbol = symbol
+
+    def __str__(self):
+        return "<%s> caused ENCODING error, %s is not a known %s status\n Traceback: %s" % \
+               (self.__class__.__name__, self.symbol, self.rawdataType, self.traceback)
@@ -1,5 +1,5 @@
-from hmmlearn.hmm import _BaseHMM
-from hmmlearn.utils import normalize
+from hmmlearn.base import _BaseHMM
+from sklearn.utils import check_random_state
 import numpy as np
 import string
 
@@ -7,8 +7,27 @@ NEGINF = -np.inf
 
 
 class DiscreteHMM(_BaseHMM):
+    '''HMM whose emission is a product of independent categorical distributions, one per feature
+
+    An obs seq is an int array of shape (n_samples, n_features), its column f holds
+    symbol indexes of feature f (e.g. motion, location, sound encoded by Dataset).
+    The emission log probability of a frame is the sum of one table lookup per feature.
+
+    Attributes
+    ----------
+    n_symbols: list of int
+      vocabulary size of every feature
+    emission_prior: float
+      pseudo count added to every symbol in M-step, so symbols unseen in training keep a finite log probability
+    emissionlogprobs_: list of array, shape (n_components, n_symbols[f])
+      log-space emission table of every feature
+    '''
+
     def __init__(self,
         n_components=1,  # Number of states in the model.
+        n_symbols=None,  # Vocabulary size of every feature, inferred from the training seqs if None.
+        emissionlogprobs=None,  # Log-space emission table of every feature.
+        emission_prior=1e-2,  # Pseudo count of every symbol in M-step.
 
         startprob=None,  # Initial state occupation distribution.
         transmat=None,  # Matrix of transition probabilities between states.
@@ -23,11 +42,11 @@ class DiscreteHMM(_BaseHMM):
 
         params=string.ascii_letters,
         # Controls which parameters are updated in the training process.
-        # Can contain any combination of 's' for startprob, 't' for transmat, etc.
+        # Can contain any combination of 's' for startprob, 't' for transmat, 'e' for emission tables.
         # Defaults to all parameters.
         init_params=string.ascii_letters
         # Controls which parameters are initialized prior to training.
-        # Can contain any combination of 's' for startprob, 't' for transmat, etc.
+        # Can contain any combination of 's' for startprob, 't' for transmat, 'e' for emission tables.
         # Defaults to all parameters.
         ):
 
@@ -37,39 +56,53 @@ class DiscreteHMM(_BaseHMM):
                           random_state=random_state, n_iter=n_iter,
                           thresh=thresh, params=params,
                           init_params=init_params)
-
-    def _get_emissionmat(self):
-        """Emission probability distribution for each state."""
-        return self._emissionmat_
-
-    def _set_emissionmat(self, emissionprob):
-        # Convert list to numpy array.
-        emissionprob = np.asarray(emissionprob)
-        if hasattr(self, 'n_symbols') and emissionprob.shape != (self.n_components, self.n_symbols):
-            raise ValueError('emissionprob must have shape '
-                             '(n_components, n_symbols)')
-
-        # check if there exists a component whose value is exactly zero
-        # if so, add a small number and re-normalize
-        if not np.alltrue(emissionprob):
-            normalize(emissionprob)
-        self._emissionmat_ = emissionprob
-        # check if there exists any element whose value is NaN
-        underflow_idx = np.isnan(self._emissionmat_)
-        # set the NaN value as negative inf.
-        self._emissionmat_[underflow_idx] = NEGINF
-        self.n_symbols = self._emissionmat_.shape[1]
-
-    # Property: emission matrix
-    emissionmat_ = property(_get_emissionmat, _set_emissionmat)
+        self.n_symbols = list(n_symbols) if n_symbols is not None else None
+        self.emission_prior = emission_prior
+        if emissionlogprobs is not None:
+            self.emissionlogprobs_ = emissionlogprobs
+
+    def _get_emissionlogprobs(self):
+        """Log-space emission table of every feature."""
+        return self._emissionlogprobs_
+
+    def _set_emissionlogprobs(self, emissionlogprobs):
+        # Convert lists to numpy arrays.
+        emissionlogprobs = [np.asarray(table, dtype=float) for table in emissionlogprobs]
+        shapes = [(self.n_components, n) for n in self.n_symbols] if self.n_symbols is not None else None
+        if shapes is not None and [table.shape for table in emissionlogprobs] != shapes:
+            raise ValueError('emissionlogprobs must have shapes %s' % (shapes,))
+        self._emissionlogprobs_ = emissionlogprobs
+        self.n_symbols = [table.shape[1] for table in emissionlogprobs]
+
+    # Property: log-space emission tables
+    emissionlogprobs_ = property(_get_emissionlogprobs, _set_emissionlogprobs)
 
     def _compute_log_likelihood(self, obs):
-        # T is transpose.
-        return self._emissionmat_[:, obs].T
+        obs = np.asarray(obs, dtype=int)
+        framelogprob = np.zeros((len(obs), self.n_components))
+        for f, table in enumerate(self._emissionlogprobs_):
+            framelogprob += table[:, obs[:, f]].T
+        return framelogprob
+
+    def _init(self, obs, params=string.ascii_letters):
+        super(DiscreteHMM, self)._init(obs, params=params)
+        self.random_state = check_random_state(self.random_state)
+
+        if 'e' in params:
+            symbols = np.concatenate([np.asarray(seq, dtype=int) for seq in obs])
+            if self.n_symbols is None:
+                self.n_symbols = (symbols.max(axis=0) + 1).tolist()
+            # Start every state from the overall symbol frequencies, perturbed to break the symmetry
+            tables = []
+            for f, n_symbol in enumerate(self.n_symbols):
+                counts = np.bincount(symbols[:, f], minlength=n_symbol) + self.emission_prior
+                probs = counts * self.random_state.uniform(.5, 1.5, (self.n_components, n_symbol))
+                tables.append(np.log(probs / probs.sum(axis=1)[:, np.newaxis]))
+            self.emissionlogprobs_ = tables
 
     def _initialize_sufficient_statistics(self):
         stats = super(DiscreteHMM, self)._initialize_sufficient_statistics()
-        stats['obs'] = np.zeros((self.n_components, self.n_symbols))
+        stats['obs'] = [np.zeros((self.n_components, n_symbol)) for n_symbol in self.n_symbols]
         return stats
 
     def _accumulate_sufficient_statistics(self, stats, obs, framelogprob,
@@ -79,9 +112,17 @@ class DiscreteHMM(_BaseHMM):
             stats, obs, framelogprob, posteriors, fwdlattice, bwdlattice,
             params)
         if 'e' in params:
-            for t, symbol in enumerate(obs):
-                stats['obs'][:, symbol] += posteriors[t]
-
+            obs = np.asarray(obs, dtype=int)
+            for f, counts in enumerate(stats['obs']):
+                # counts.T[symbol] += posteriors[t] for every frame t, repeated symbols accumulate
+                np.add.at(counts.T, obs[:, f], posteriors)
 
     def _do_mstep(self, stats, params):
-        super(DiscreteHMM, self)._do_mstep(stats, params)
\ No newline at end of file
+        super(DiscreteHMM, self)._do_mstep(stats, params)
+        if 'e' in params:
+            tables = []
+            for counts in stats['obs']:
+                counts = counts + self.emission_prior
+                with np.errstate(divide='ignore'):
+                    tables.append(np.log(counts / counts.sum(axis=1)[:, np.newaxis]))
+            self.emissionlogprobs_ = tables
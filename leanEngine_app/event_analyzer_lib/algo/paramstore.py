@@ -0,0 +1,99 @@
+import json
+import os
+import struct
+import urllib
+import numpy as np
+
+MAGIC = 'SENZPRM2'
+DTYPE = np.dtype('<f8')
+ALIGNMENT = 64  # data starts on a cache line
+
+
+def paramStorePath(store_dir, algo_type, tag):
+    '''Path of the param file of (algo_type, tag), one flat file per tag
+    '''
+    if isinstance(tag, unicode):
+        tag = tag.encode('utf-8')
+    return os.path.join(store_dir, algo_type, '%s.params' % urllib.quote(tag, safe=''))
+
+
+def writeParamStore(path, version, items):
+    '''Write the packed params of a tag to one flat file
+
+    The file is written beside `path` and renamed over it, so readers never
+    see a partial file and workers still mapping the old file keep their pages.
+
+    File layout: MAGIC | header length (uint64 little-endian) | JSON header | padding | float64 data
+
+    Parameters
+    ----------
+    path: string
+    version: string, version stamp of the tag's models
+    items: list of dict
+      {'meta': JSON-serializable dict, 'arrays': dict of name to array}
+    '''
+    header = {'version': version, 'items': []}
+    chunks = []
+    offset = 0
+    for item in items:
+        layout = {}
+        for name, array in item['arrays'].iteritems():
+            array = np.ascontiguousarray(array, dtype=DTYPE)
+            layout[name] = [offset, list(array.shape)]
+            chunks.append(array.ravel())
+            offset += array.size
+        header['items'].append({'meta': item['meta'], 'arrays': layout})
+    header_bytes = json.dumps(header)
+    data_offset = len(MAGIC) + 8 + len(header_bytes)
+    padding = -data_offset % ALIGNMENT
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # Created by another worker meanwhile
+            if not os.path.isdir(directory):
+                raise
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        f.write('\0' * padding)
+        for chunk in chunks:
+            f.write(chunk.tostring())
+    os.rename(tmp_path, path)
+
+
+def readParamStore(path):
+    '''Map a param file read-only
+
+    Returns
+    -------
+    version: string, None if there is no file at path
+    items: list of dict, same as `writeParamStore`'s,
+      the arrays are read-only views on one numpy.memmap shared through the page cache
+    '''
+    try:
+        f = open(path, 'rb')
+    except IOError:
+        return None, []
+    with f:
+        if f.read(len(MAGIC)) != MAGIC:
+            # Written by another format version, to be rewritten
+            return None, []
+        header_length, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_length))
+    data_offset = len(MAGIC) + 8 + header_length
+    data_offset += -data_offset % ALIGNMENT
+
+    size = sum(int(np.prod(shape)) for item in header['items'] for _, shape in item['arrays'].itervalues())
+    data = np.memmap(path, dtype=DTYPE, mode='r', offset=data_offset, shape=(size,)) if size else np.empty(0, DTYPE)
+    items = []
+    for item in header['items']:
+        arrays = {}
+        for name, (offset, shape) in item['arrays'].iteritems():
+            arrays[name] = data[offset:offset + int(np.prod(shape))].reshape(shape)
+        items.append({'meta': item['meta'], 'arrays': arrays})
+    return header['version'], items
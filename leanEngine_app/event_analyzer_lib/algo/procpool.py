@@ -0,0 +1,123 @@
+# coding: utf-8
+
+__all__ = ["mapInProcesses", "ChildJobError", "jobErrorMessage"]
+
+import cPickle as pickle
+import os
+import sys
+import traceback
+
+import gevent.os
+from gevent.pool import Pool
+
+
+class ChildJobError(Exception):
+    '''A job failed in its child process
+
+    The message is the last line of the child's traceback, e.g. "KeyError: 'sound'",
+    the whole traceback is in `traceback`.
+    '''
+
+    def __init__(self, message, traceback=''):
+        Exception.__init__(self, message)
+        self.traceback = traceback
+
+
+def mapInProcesses(func, jobs, processes):
+    '''
+    在子进程中并行执行 func(job), 每个 job 一个子进程, 同时最多 processes 个
+
+    Children are forked, so func and jobs are inherited as they are and need not be picklable,
+    only the results are pickled back through a pipe. The parent waits on the pipes cooperatively,
+    which keeps it working inside a gevent monkey-patched worker, where multiprocessing.Pool hangs.
+
+    func runs CPU work only: a child must not use the parent's connections or greenlets.
+
+    Parameters
+    ----------
+    func: callable, func(job) returns a picklable result
+    jobs: iterable
+    processes: int, jobs run in this process one by one if processes <= 1 or there is only one job
+
+    Returns
+    -------
+    results: list of tuple (result, error), in the order of jobs
+      error is None if the job succeeded, else the exception it raised, a ChildJobError if it ran in a child,
+      a failed job doesn't stop the others
+    '''
+    jobs = list(jobs)
+    if processes <= 1 or len(jobs) <= 1:
+        return [_runHere(func, job) for job in jobs]
+    return Pool(processes).map(lambda job: _runInChild(func, job), jobs)
+
+
+def jobErrorMessage(error):
+    '''One line message of an error returned by mapInProcesses, the same whether the job ran here or in a child,
+    e.g. "KeyError: 'sound'"
+    '''
+    if isinstance(error, ChildJobError):
+        return str(error)
+    return traceback.format_exception_only(error.__class__, error)[-1].strip()
+
+
+def _runHere(func, job):
+    try:
+        return func(job), None
+    except Exception, e:
+        return None, e
+
+
+def _runInChild(func, job):
+    try:
+        return _forkJob(func, job), None
+    except Exception, e:
+        return None, e
+
+
+def _forkJob(func, job):
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        _childMain(func, job, w)
+
+    os.close(w)
+    chunks = []
+    try:
+        gevent.os.make_nonblocking(r)
+        while True:
+            chunk = gevent.os.nb_read(r, 65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        os.close(r)
+        os.waitpid(pid, 0)
+
+    if not chunks:
+        raise ChildJobError('child %s exited without a result' % (pid))
+    ok, result = pickle.loads(''.join(chunks))
+    if not ok:
+        raise ChildJobError(result.strip().splitlines()[-1], result)
+    return result
+
+
+def _childMain(func, job, w):
+    # Never returns: the child must not go on running the parent's code after the job
+    status = 0
+    try:
+        try:
+            data = pickle.dumps((True, func(job)), pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            data = pickle.dumps((False, traceback.format_exc()), pickle.HIGHEST_PROTOCOL)
+        view = memoryview(data)
+        while view:
+            view = view[os.write(w, view):]
+    except BaseException:
+        status = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
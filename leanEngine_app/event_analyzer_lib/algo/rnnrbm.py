@@ -18,6 +18,7 @@ except ImportError:
     print "It can be installed with 'pip install -q Pillow'"
 
 #from midi.utils import midiread, midiwrite
+from procpool import mapInProcesses, jobErrorMessage
 import theano
 import theano.tensor as T
 from theano.tensor.shared_randomstreams import RandomStreams
@@ -266,7 +267,9 @@ class RnnRbm:
             #     params_values = [params_dict[name] for name in params_strs]
             #     self.set_params_function(params_values)
             params_strs = ['W', 'bv', 'bh', 'Wuh', 'Wuv', 'Wvu', 'Wuu', 'bu']
-            [param.set_value(score_params_dict[name]) for param,name in zip(params,params_strs)]  #set each shared_value value
+            # stored params may be float32 buffers or lists of old rows, cast to floatX before set
+            [param.set_value(numpy.asarray(score_params_dict[name], dtype=theano.config.floatX))
+             for param,name in zip(params,params_strs)]  #set each shared_value value
 
             self.score_function = theano.function(
             [v],
@@ -487,18 +490,31 @@ class Comparator(object):
         most_likely_event = min(scores_dict.items(),key=lambda x:abs(x[1]))
         return most_likely_event[0]
 
-    def fit(self, seqs_dict):
+    def fit(self, seqs_dict, processes=1):
         '''
 
         :param seqs_dict: {"dining_in_restaurant:[[one binary seq],[one binary seq]]}
-        :return: params_dict: params for every model. some params are ndarray type,need to be transformed in the upper layer
+        :param processes: models are trained in this many child processes at a time, 1 trains them here one by one.
+                          models trained in children keep their old params in this process, use the returned params_dict
+        :return: params_dict: params for every model trained. some params are ndarray type,need to be transformed in the upper layer
+                 models failed to train are left out, self.failures_ = {event: error message}
         '''
-        params_dict = {}
-        for event,model in self.candidates.items():
+        def train(candidate):
+            event, model = candidate
             print "event",event
             print "model",model
             model.train(dataset=seqs_dict[event])
-            params_dict.update({event:model.params})
+            return model.params
+
+        candidates = self.candidates.items()
+        params_dict = {}
+        self.failures_ = {}
+        for (event, _), (params, error) in zip(candidates, mapInProcesses(train, candidates, processes)):
+            if error is None:
+                params_dict.update({event:params})
+            else:
+                print "event %s failed to train: %s" % (event, getattr(error, 'traceback', None) or error)
+                self.failures_[event] = jobErrorMessage(error)
         print "params dict",params_dict
         return params_dict
 
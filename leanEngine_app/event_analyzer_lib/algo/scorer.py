@@ -0,0 +1,538 @@
+from scipy import linalg
+from exception import ModelParamKeyError, CovarianceTypeError
+import numpy as np
+
+LOG_2PI = np.log(2 * np.pi)
+MIN_COVAR = 1.e-7  # same regularization sklearn applies to a non positive-definite covariance
+
+
+class PackedGMMEmission(object):
+    '''GMM emissions of all hidden states packed into compact arrays
+
+    Covariance inverses, log determinants and log weights are computed once at
+    load, so evaluating every state's mixture on a seq takes a few matrix products.
+
+    Attributes
+    ----------
+    covariance_type: string
+    n_component: int, number of hidden states
+    n_mix: int
+    n_features: int
+    log_consts: array, shape (n_component * n_mix,)
+      log weight - (n_features * log(2pi) + log|covar| + mu' P mu) / 2
+    linear: array, shape (n_features, n_component * n_mix)
+      P mu of every mixture for 'spherical' & 'diag'
+    precisions: array, shape (n_features, n_component * n_mix)
+      diagonal precisions for 'spherical' & 'diag'
+    prec_chols: array, shape (n_features, n_component * n_mix * n_features)
+      transposed inverse Cholesky factors for 'tied' & 'full'
+    prec_chol_means: array, shape (n_component * n_mix * n_features,)
+      means projected by prec_chols for 'tied' & 'full'
+    '''
+
+    def __init__(self, gmms):
+        covariance_types = set(gmm['covarianceType'] for gmm in gmms)
+        if len(covariance_types) != 1:
+            raise CovarianceTypeError("inconformity")
+        self.covariance_type = covariance_types.pop()
+        means = np.array([gmm['means'] for gmm in gmms], dtype=float)
+        with np.errstate(divide='ignore'):
+            log_weights = np.log(np.array([gmm['weights'] for gmm in gmms], dtype=float))
+        self.n_component, self.n_mix, self.n_features = means.shape
+        n_features = self.n_features
+        means = means.reshape(-1, n_features)
+
+        if self.covariance_type in ('spherical', 'diag'):
+            covars = []
+            for gmm in gmms:
+                cv = np.asarray(gmm['covars'], dtype=float)
+                if cv.ndim == 1:
+                    cv = cv[:, np.newaxis]
+                if cv.shape[1] == 1:
+                    cv = np.tile(cv, (1, n_features))
+                covars.append(cv)
+            covars = np.concatenate(covars)
+            precisions = 1.0 / covars
+            self.precisions = precisions.T.copy()
+            self.linear = (means * precisions).T.copy()
+            log_dets = np.sum(np.log(covars), axis=1)
+            quads = np.sum(means ** 2 * precisions, axis=1)
+        elif self.covariance_type in ('tied', 'full'):
+            covars = []
+            for gmm in gmms:
+                cv = np.asarray(gmm['covars'], dtype=float)
+                if self.covariance_type == 'tied':
+                    cv = np.tile(cv, (self.n_mix, 1, 1))
+                covars.append(cv)
+            covars = np.concatenate(covars)
+            prec_chols = np.empty_like(covars)
+            log_dets = np.empty(len(covars))
+            for c, cv in enumerate(covars):
+                try:
+                    cv_chol = linalg.cholesky(cv, lower=True)
+                except linalg.LinAlgError:
+                    cv_chol = linalg.cholesky(cv + MIN_COVAR * np.eye(n_features), lower=True)
+                log_dets[c] = 2 * np.sum(np.log(np.diagonal(cv_chol)))
+                prec_chols[c] = linalg.solve_triangular(cv_chol, np.eye(n_features), lower=True).T
+            # (n_features, n_component * n_mix * n_features), so one product projects X for all mixtures
+            self.prec_chols = prec_chols.transpose(1, 0, 2).reshape(n_features, -1).copy()
+            self.prec_chol_means = np.einsum('cf,cfg->cg', means, prec_chols).ravel()
+            quads = 0
+        else:
+            raise CovarianceTypeError(self.covariance_type)
+
+        self.log_consts = log_weights.ravel() - .5 * (n_features * LOG_2PI + log_dets + quads)
+
+    def pack(self):
+        '''Flatten to (meta, arrays) for the param store, `unpack` restores the instance
+        '''
+        meta = {'covarianceType': self.covariance_type, 'nComponent': self.n_component,
+                'nMix': self.n_mix, 'nFeatures': self.n_features}
+        if self.covariance_type in ('spherical', 'diag'):
+            names = ['log_consts', 'linear', 'precisions']
+        else:
+            names = ['log_consts', 'prec_chols', 'prec_chol_means']
+        return meta, dict((name, getattr(self, name)) for name in names)
+
+    @classmethod
+    def unpack(cls, meta, arrays):
+        '''Rebuild from `pack` output without copying the arrays, which may be read-only memmap views
+        '''
+        emission = cls.__new__(cls)
+        emission.covariance_type = meta['covarianceType']
+        emission.n_component = meta['nComponent']
+        emission.n_mix = meta['nMix']
+        emission.n_features = meta['nFeatures']
+        for name, array in arrays.iteritems():
+            setattr(emission, name, array)
+        return emission
+
+    @classmethod
+    def stack(cls, emissions):
+        '''Concatenate the states of emissions sharing covariance type, n_mix and n_features
+
+        The result scores the states of all emissions in one pass, its
+        framelogprob has shape (n_samples, sum of n_component).
+        '''
+        first = emissions[0]
+        meta, arrays = first.pack()
+        meta['nComponent'] = sum(emission.n_component for emission in emissions)
+        for name in arrays:
+            # log_consts & prec_chol_means are flat, the other arrays have the states on axis 1
+            axis = 0 if name in ('log_consts', 'prec_chol_means') else 1
+            arrays[name] = np.concatenate([getattr(emission, name) for emission in emissions], axis=axis)
+        return cls.unpack(meta, arrays)
+
+    def stackKey(self):
+        return ('gmm', self.covariance_type, self.n_component, self.n_mix, self.n_features)
+
+    def framelogprob(self, X):
+        '''Emission log probabilities of every state, shape (n_samples, n_component)
+        '''
+        X = np.asarray(X, dtype=float)
+        if self.covariance_type in ('spherical', 'diag'):
+            lpr = np.dot(X, self.linear) - .5 * np.dot(X ** 2, self.precisions)
+        else:
+            projected = np.dot(X, self.prec_chols) - self.prec_chol_means
+            lpr = -.5 * np.sum((projected ** 2).reshape(len(X), -1, self.n_features), axis=2)
+        lpr += self.log_consts
+        return logsumexp(lpr.reshape(len(X), self.n_component, self.n_mix))
+
+
+class BaseHMMScorer(object):
+    '''Forward-algorithm scoring shared by the scorers, subclasses give `framelogprob`
+
+    Attributes
+    ----------
+    n_component: int
+    startprob: array, shape (n_component,)
+    transmat: array, shape (n_component, n_component)
+    '''
+
+    def __init__(self, hmm_params):
+        self.n_component = hmm_params['nComponent']
+        self.startprob = np.asarray(hmm_params['startProb'], dtype=float)
+        self.transmat = np.asarray(hmm_params['transMat'], dtype=float)
+
+    def framelogprob(self, X):
+        raise NotImplementedError
+
+    def forward(self, framelogprob):
+        '''Log probability of a seq given its emission log probabilities
+        '''
+        return forward_state(self.startprob, self.transmat, framelogprob)[1]
+
+    def forward_state(self, framelogprob, state=None):
+        '''Carry the forward recursion of a seq on by framelogprob, see `forward_state`
+        '''
+        return forward_state(self.startprob, self.transmat, framelogprob, state)
+
+    def score(self, X):
+        return self.forward(self.framelogprob(X))
+
+    def score_batch(self, X, lengths):
+        '''Score the seqs stacked in X, `lengths` are their frame counts
+        '''
+        framelogprob = self.framelogprob(X)
+        logprobs = []
+        start = 0
+        for length in lengths:
+            logprobs.append(self.forward(framelogprob[start:start + length]))
+            start += length
+        return logprobs
+
+
+class GMMHMMScorer(BaseHMMScorer):
+    '''Forward-algorithm scorer built directly from GMMHMM params
+
+    The params are the dict produced by `GMMHMMTrainer.fit`, no hmmlearn / sklearn
+    object is created. `score(X)` equals hmmlearn's `GMMHMM.score(X)`.
+
+    Attributes
+    ----------
+    n_component: int
+    startprob: array, shape (n_component,)
+    transmat: array, shape (n_component, n_component)
+    emission: PackedGMMEmission
+    '''
+
+    def __init__(self, params):
+        gmm_params = params['gmmParams']
+        gmms = gmm_params.get('gmms', None)
+        if not gmms:
+            raise ModelParamKeyError('gmms')
+
+        super(GMMHMMScorer, self).__init__(params['hmmParams'])
+        self.emission = PackedGMMEmission(gmms)
+
+    def framelogprob(self, X):
+        '''Emission log probabilities, shape (n_samples, n_component)
+        '''
+        return self.emission.framelogprob(X)
+
+
+class PackedCategoricalEmission(object):
+    '''Per-feature categorical emissions of all hidden states stacked into one log table
+
+    Attributes
+    ----------
+    n_component: int, number of hidden states
+    offsets: array, shape (n_features,), first row of every feature in `table`
+    table: array, shape (sum of n_symbols, n_component)
+    '''
+
+    def __init__(self, offsets, table):
+        self.offsets = np.asarray(offsets, dtype=int)
+        self.table = table
+        self.n_component = table.shape[1]
+
+    @classmethod
+    def stack(cls, emissions):
+        '''Concatenate the states of emissions sharing their features' vocabularies
+        '''
+        return cls(emissions[0].offsets, np.concatenate([emission.table for emission in emissions], axis=1))
+
+    def stackKey(self):
+        return ('categorical', self.n_component, tuple(self.offsets.tolist()), self.table.shape[0])
+
+    def pack(self):
+        return {'nComponent': self.n_component, 'offsets': self.offsets.tolist()}, {'table': self.table}
+
+    @classmethod
+    def unpack(cls, meta, arrays):
+        return cls(meta['offsets'], arrays['table'])
+
+    def framelogprob(self, X):
+        '''Emission log probabilities of every state, shape (n_samples, n_component)
+        '''
+        X = np.asarray(X, dtype=int)
+        return self.table[X + self.offsets].sum(axis=1)
+
+
+class DiscreteHMMScorer(BaseHMMScorer):
+    '''Forward-algorithm scorer built directly from DiscreteHMM params
+
+    The per-feature log tables are stacked into one (sum of n_symbols, n_component)
+    table, a frame's emission log probabilities are one gather and a sum over features.
+    `score(X)` equals `DiscreteHMM.score(X)`.
+
+    Attributes
+    ----------
+    n_component: int
+    startprob: array, shape (n_component,)
+    transmat: array, shape (n_component, n_component)
+    emission: PackedCategoricalEmission
+    '''
+
+    def __init__(self, params):
+        emission_params = params['emissionParams']
+        tables = emission_params.get('emissionLogProbs', None)
+        if not tables:
+            raise ModelParamKeyError('emissionLogProbs')
+
+        super(DiscreteHMMScorer, self).__init__(params['hmmParams'])
+        tables = [np.asarray(table, dtype=float) for table in tables]
+        offsets = np.cumsum([0] + [table.shape[1] for table in tables[:-1]])
+        self.emission = PackedCategoricalEmission(offsets, np.ascontiguousarray(np.concatenate(tables, axis=1).T))
+
+    def framelogprob(self, X):
+        '''Emission log probabilities, shape (n_samples, n_component)
+        '''
+        return self.emission.framelogprob(X)
+
+
+class StackedHMMScorer(object):
+    '''Scores the HMMs of several events at once
+
+    The scorers must have the same class, number of states and emission shape
+    (see `stackKey`). Their emissions are concatenated, so every frame is evaluated
+    for all events by one emission pass, and the forward recursions of all events
+    run together on (n_event, n_component) arrays.
+
+    Attributes
+    ----------
+    n_event: int
+    n_component: int
+    startprob: array, shape (n_event, n_component)
+    transmat: array, shape (n_event, n_component, n_component)
+    emission: stacked emission of all events
+    '''
+
+    EMISSIONS = {'PackedGMMEmission': PackedGMMEmission, 'PackedCategoricalEmission': PackedCategoricalEmission}
+
+    def __init__(self, scorers):
+        self.n_event = len(scorers)
+        self.n_component = scorers[0].n_component
+        self.startprob = np.array([scorer.startprob for scorer in scorers])
+        self.transmat = np.array([scorer.transmat for scorer in scorers])
+        self.emission = scorers[0].emission.stack([scorer.emission for scorer in scorers])
+
+    def pack(self):
+        '''Flatten to (meta, arrays) for the param store, `unpack` restores the instance
+        '''
+        emission_meta, emission_arrays = self.emission.pack()
+        arrays = {'startprob': self.startprob, 'transmat': self.transmat}
+        for name, array in emission_arrays.iteritems():
+            arrays['emission.' + name] = array
+        meta = {'nEvent': self.n_event, 'nComponent': self.n_component,
+                'emissionType': self.emission.__class__.__name__, 'emission': emission_meta}
+        return meta, arrays
+
+    @classmethod
+    def unpack(cls, meta, arrays):
+        '''Rebuild from `pack` output without copying the arrays, which may be read-only memmap views
+        '''
+        scorer = cls.__new__(cls)
+        scorer.n_event = meta['nEvent']
+        scorer.n_component = meta['nComponent']
+        scorer.startprob = arrays['startprob']
+        scorer.transmat = arrays['transmat']
+        emission_arrays = dict((name[len('emission.'):], array) for name, array in arrays.iteritems()
+                               if name.startswith('emission.'))
+        scorer.emission = cls.EMISSIONS[meta['emissionType']].unpack(meta['emission'], emission_arrays)
+        return scorer
+
+    @staticmethod
+    def stackKey(scorer):
+        '''Scorers with equal keys can be stacked, None if the scorer can't be stacked
+        '''
+        emission = getattr(scorer, 'emission', None)
+        if emission is None or not hasattr(emission, 'stackKey'):
+            return None
+        return (scorer.__class__.__name__, ) + emission.stackKey()
+
+    def framelogprob(self, X):
+        '''Emission log probabilities, shape (n_samples, n_event, n_component)
+        '''
+        return self.emission.framelogprob(X).reshape(len(X), self.n_event, self.n_component)
+
+    def forward(self, framelogprob):
+        return stacked_forward_state(self.startprob, self.transmat, framelogprob)[1]
+
+    def forward_state(self, framelogprob, state=None):
+        return stacked_forward_state(self.startprob, self.transmat, framelogprob, state)
+
+    def score(self, X):
+        '''Log probabilities of seq X under every event, shape (n_event,)
+        '''
+        return self.forward(self.framelogprob(X))
+
+    def score_batch(self, X, lengths):
+        '''Score the seqs stacked in X, `lengths` are their frame counts
+
+        Returns
+        -------
+        logprobs: list of array, shape (n_event,), one for each seq
+        '''
+        framelogprob = self.framelogprob(X)
+        logprobs = []
+        start = 0
+        for length in lengths:
+            logprobs.append(self.forward(framelogprob[start:start + length]))
+            start += length
+        return logprobs
+
+
+class UnstackedScorer(object):
+    '''Adapter giving a scorer that can't be stacked the StackedHMMScorer interface, as a stack of one
+    '''
+
+    n_event = 1
+
+    def __init__(self, scorer):
+        self.scorer = scorer
+
+    def framelogprob(self, X):
+        return self.scorer.framelogprob(X)[:, np.newaxis, :]
+
+    def forward_state(self, framelogprob, state=None):
+        if state is not None:
+            state = (state[0][0], state[1][0])
+        alpha, logprob = self.scorer.forward_state(framelogprob[:, 0, :], state)
+        return alpha[np.newaxis], np.array([logprob])
+
+    def score(self, X):
+        return np.array([self.scorer.score(X)])
+
+    def score_batch(self, X, lengths):
+        return [np.array([logprob]) for logprob in self.scorer.score_batch(X, lengths)]
+
+
+class HMMLearnScorer(object):
+    '''Adapter giving an hmmlearn GMMHMM instance the GMMHMMScorer interface
+    '''
+
+    def __init__(self, gmmhmm):
+        self.gmmhmm = gmmhmm
+
+    def framelogprob(self, X):
+        return self.gmmhmm._compute_log_likelihood(np.asarray(X))
+
+    def forward(self, framelogprob):
+        logprob, _ = self.gmmhmm._do_forward_pass(framelogprob)
+        return logprob
+
+    def forward_state(self, framelogprob, state=None):
+        return forward_state(self.gmmhmm.startprob_, self.gmmhmm.transmat_, framelogprob, state)
+
+    def score(self, X):
+        return self.gmmhmm.score(np.asarray(X))
+
+    def score_batch(self, X, lengths):
+        framelogprob = self.framelogprob(X)
+        logprobs = []
+        start = 0
+        for length in lengths:
+            logprobs.append(self.forward(framelogprob[start:start + length]))
+            start += length
+        return logprobs
+
+
+def forward_state(startprob, transmat, framelogprob, state=None):
+    '''Forward recursion over framelogprob, carried on from state
+
+    Each frame is shifted by its max log probability and the forward vector is
+    renormalized at every step, the shifts and scales are summed in log space.
+
+    Parameters
+    ----------
+    startprob: array, shape (n_component,)
+    transmat: array, shape (n_component, n_component)
+    framelogprob: array, shape (n_samples, n_component)
+    state: tuple (alpha, logprob) returned by a previous call, None starts a new seq
+
+    Returns
+    -------
+    state: tuple (alpha, logprob)
+      alpha is the forward vector normalized to sum 1,
+      logprob is the log probability of every frame seen so far
+    '''
+    n_component = len(startprob)
+    frame_max = np.max(framelogprob, axis=1)
+    if not np.all(np.isfinite(frame_max)) or (state is not None and not np.isfinite(state[1])):
+        return np.zeros(n_component), -np.inf
+    emissions = np.exp(framelogprob - frame_max[:, np.newaxis])
+    if state is None:
+        alpha = startprob * emissions[0]
+        logprob = 0.
+    else:
+        alpha = np.dot(state[0], transmat) * emissions[0]
+        logprob = state[1]
+    scales = np.empty(len(emissions))
+    scales[0] = alpha.sum()
+    for t in xrange(1, len(emissions)):
+        if scales[t - 1] <= 0:
+            return np.zeros(n_component), -np.inf
+        alpha = np.dot(alpha / scales[t - 1], transmat) * emissions[t]
+        scales[t] = alpha.sum()
+    if scales[-1] <= 0:
+        return np.zeros(n_component), -np.inf
+    return alpha / scales[-1], logprob + np.sum(frame_max) + np.sum(np.log(scales))
+
+
+def stacked_forward_state(startprob, transmat, framelogprob, state=None):
+    '''`forward_state` of several HMMs with the same number of states at once
+
+    Parameters
+    ----------
+    startprob: array, shape (n_event, n_component)
+    transmat: array, shape (n_event, n_component, n_component)
+    framelogprob: array, shape (n_samples, n_event, n_component)
+    state: tuple (alpha, logprob) returned by a previous call, None starts a new seq
+
+    Returns
+    -------
+    state: tuple (alpha, logprob)
+      alpha has shape (n_event, n_component), every row normalized to sum 1,
+      logprob has shape (n_event,)
+    '''
+    frame_max = np.max(framelogprob, axis=2)
+    impossible = ~np.all(np.isfinite(frame_max), axis=0)
+    if state is not None:
+        impossible |= ~np.isfinite(state[1])
+    frame_max = np.where(np.isfinite(frame_max), frame_max, 0)
+    emissions = np.exp(framelogprob - frame_max[:, :, np.newaxis])
+    if state is None:
+        alpha = startprob * emissions[0]
+        logprob = np.zeros(len(startprob))
+    else:
+        alpha = np.matmul(state[0][:, np.newaxis, :], transmat)[:, 0, :] * emissions[0]
+        logprob = np.where(impossible, 0, state[1])
+    scales = np.empty(emissions.shape[:2])
+    scales[0] = alpha.sum(axis=1)
+    for t in xrange(1, len(emissions)):
+        scale = np.where(scales[t - 1] > 0, scales[t - 1], 1)
+        alpha = np.matmul((alpha / scale[:, np.newaxis])[:, np.newaxis, :], transmat)[:, 0, :] * emissions[t]
+        scales[t] = alpha.sum(axis=1)
+    impossible |= np.any(scales <= 0, axis=0)
+    scales[:, impossible] = 1
+    alpha = alpha / scales[-1][:, np.newaxis]
+    logprob = logprob + np.sum(frame_max, axis=0) + np.sum(np.log(scales), axis=0)
+    alpha[impossible] = 0
+    logprob[impossible] = -np.inf
+    return alpha, logprob
+
+
+def logsumexp(a):
+    '''logsumexp over the last axis, -inf rows stay -inf
+    '''
+    a_max = np.max(a, axis=-1)
+    a_max_safe = np.where(np.isfinite(a_max), a_max, 0)
+    with np.errstate(divide='ignore'):
+        return np.log(np.sum(np.exp(a - a_max_safe[..., np.newaxis]), axis=-1)) + a_max_safe
+
+
+if __name__ == '__main__':
+    # Per-request timing of both engines on randomly trained models, parity is checked by test_scorer.py
+    import timeit
+    from classifier import GMMHMMClassifier
+    from test_scorer import trainModels, COVARIANCE_TYPES
+
+    for covariance_type in COVARIANCE_TYPES:
+        models, seqs = trainModels(covariance_type)
+        hmmlearn_classifier = GMMHMMClassifier(models, engine='hmmlearn')
+        numpy_classifier = GMMHMMClassifier(models, engine='numpy')
+        hmmlearn_time = timeit.timeit(lambda: hmmlearn_classifier.predict(seqs[0]), number=200) / 200
+        numpy_time = timeit.timeit(lambda: numpy_classifier.predict(seqs[0]), number=200) / 200
+        print('%s: hmmlearn %.3f ms/request, numpy %.3f ms/request, speedup %.1fx'
+              % (covariance_type, hmmlearn_time * 1e3, numpy_time * 1e3, hmmlearn_time / numpy_time))
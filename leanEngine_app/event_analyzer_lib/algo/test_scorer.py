@@ -0,0 +1,89 @@
+'''Parity of the NumPy forward scorers with hmmlearn on seeded, randomly trained GMMHMMs
+
+    $ cd event_analyzer_lib/algo && python test_scorer.py
+
+The timing of both engines is in `python scorer.py`.
+'''
+
+import random
+
+import numpy as np
+
+from datasets import Dataset, statusSetFingerprint
+from trainer import GMMHMMTrainer
+from classifier import GMMHMMClassifier
+from scorer import GMMHMMScorer, StackedHMMScorer, forward_state
+
+EVENTS = ['dining_in_restaurant', 'shopping_in_mall', 'work_in_office', 'exercise_outdoor']
+COVARIANCE_TYPES = ['full', 'diag', 'spherical']
+
+
+def trainModels(covariance_type, seed=1):
+    '''GMMHMM models of EVENTS trained on seeded random observations, in the classifiers' input format
+    '''
+    random.seed(seed)
+    np.random.seed(seed)
+    d = Dataset()
+    status_set = {'motion': d.motion_type, 'sound': d.sound_type, 'location': d.location_type}
+    transmat = np.random.dirichlet(np.ones(4), 4).tolist()
+    models = {}
+    for event in EVENTS:
+        d.randomObservations(event, 10, 30)
+        my_trainer = GMMHMMTrainer({
+            'nIter': 5,
+            'hmmParams': {'nComponent': 4, 'transMat': transmat, 'transMatPrior': transmat,
+                          'startProb': [0.25] * 4, 'startProbPrior': [0.25] * 4},
+            'gmmParams': {'nMix': 4, 'covarianceType': covariance_type},
+        })
+        my_trainer.fit(d.getDataset())
+        models[event] = {'status_set': status_set, 'param': my_trainer.params_}
+    seqs = [d.randomSequence(event, 10) for event in EVENTS for _ in range(3)]
+    return models, seqs
+
+
+def assertAllClose(expected, result, message):
+    assert np.allclose(expected, result), '%s: expected %s, got %s' % (message, expected, result)
+
+
+def test_forward_state():
+    '''forward_state of every model matches hmmlearn's forward pass, whole or carried on in two parts
+    '''
+    for covariance_type in COVARIANCE_TYPES:
+        models, seqs = trainModels(covariance_type)
+        hmmlearn_classifier = GMMHMMClassifier(models, engine='hmmlearn')
+        for event in EVENTS:
+            gmmhmm = hmmlearn_classifier._buildGMMHMM(models[event]['param'])
+            scorer = GMMHMMScorer(models[event]['param'])
+            for seq in seqs:
+                X = hmmlearn_classifier.encode(seq)[statusSetFingerprint(models[event]['status_set'])]
+                framelogprob = gmmhmm._compute_log_likelihood(np.asarray(X))
+                expected, _ = gmmhmm._do_forward_pass(framelogprob)
+                assertAllClose(expected, forward_state(scorer.startprob, scorer.transmat, framelogprob)[1],
+                               '%s %s forward_state' % (covariance_type, event))
+                state = scorer.forward_state(framelogprob[:4])
+                assertAllClose(expected, scorer.forward_state(framelogprob[4:], state)[1],
+                               '%s %s carried forward_state' % (covariance_type, event))
+
+
+def test_stacked_forward_state():
+    '''stacked_forward_state scores every event like hmmlearn, whole, carried on, and through the classifiers
+    '''
+    for covariance_type in COVARIANCE_TYPES:
+        models, seqs = trainModels(covariance_type)
+        hmmlearn_classifier = GMMHMMClassifier(models, engine='hmmlearn')
+        numpy_classifier = GMMHMMClassifier(models, engine='numpy')
+        assert all(isinstance(pack['scorer'], StackedHMMScorer) for pack in numpy_classifier.packs)
+        for seq in seqs:
+            expected = hmmlearn_classifier.predict(seq)
+            result = numpy_classifier.predict(seq)
+            streamed, states = numpy_classifier.predict_stream(seq[:4])
+            streamed, _ = numpy_classifier.predict_stream(seq[4:], states)
+            for label in EVENTS:
+                assertAllClose(expected[label], result[label], '%s %s predict' % (covariance_type, label))
+                assertAllClose(expected[label], streamed[label], '%s %s predict_stream' % (covariance_type, label))
+
+
+if __name__ == '__main__':
+    for test in [test_forward_state, test_stacked_forward_state]:
+        test()
+        print '%s ok' % (test.__name__)
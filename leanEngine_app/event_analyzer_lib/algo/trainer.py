@@ -1,7 +1,10 @@
 from hmmlearn.hmm import GMMHMM
 from sklearn.mixture import GMM
 from datasets import Dataset
+from scorer import PackedGMMEmission
+from hmm import DiscreteHMM
 import numpy as np
+import string
 
 
 def trainingGMMHMM(
@@ -71,6 +74,35 @@ def trainingGMMHMM(
     return new_gmmhmm
 
 
+class PackedGMMHMM(GMMHMM):
+    '''GMMHMM whose emission constants are packed once per EM iteration
+
+    hmmlearn scores every state's sklearn GMM for each training seq, which inverts
+    every covariance again and again. Here they are packed into a PackedGMMEmission
+    after initiation / each M-step and shared by all seqs of the iteration.
+    '''
+
+    _emission = None
+
+    def _compute_log_likelihood(self, obs):
+        if self._emission is None:
+            self._emission = PackedGMMEmission([{
+                'covarianceType': gmm.covariance_type,
+                'means': gmm.means_,
+                'covars': gmm.covars_,
+                'weights': gmm.weights_,
+            } for gmm in self.gmms_])
+        return self._emission.framelogprob(obs)
+
+    def _init(self, obs, params='stwmc'):
+        super(PackedGMMHMM, self)._init(obs, params=params)
+        self._emission = None
+
+    def _do_mstep(self, stats, params):
+        super(PackedGMMHMM, self)._do_mstep(stats, params)
+        self._emission = None
+
+
 class BaseTrainer(object):
     '''Base class for all trainers
 
@@ -107,7 +139,7 @@ class GMMHMMTrainer(BaseTrainer):
     Attributes
     ----------
     _model: init params
-    gmmhmm: hmmlearn GMMHMM instance
+    gmmhmm: PackedGMMHMM instance
     params_: params after fit
     train_data_: current train datas
     '''
@@ -119,11 +151,11 @@ class GMMHMMTrainer(BaseTrainer):
         gmm_params = _model['gmmParams']
         n_iter = _model.get('nIter', 50)
 
-        transmat = np.array(hmm_params['transMat'])
-        transmat_prior = np.array(hmm_params['transMatPrior'])
+        transmat = np.array(hmm_params['transMat'], dtype=float)
+        transmat_prior = np.array(hmm_params['transMatPrior'], dtype=float)
         n_component = hmm_params['nComponent']
-        startprob = np.array(hmm_params['startProb'])
-        startprob_prior = np.array(hmm_params['startProbPrior'])
+        startprob = np.array(hmm_params['startProb'], dtype=float)
+        startprob_prior = np.array(hmm_params['startProbPrior'], dtype=float)
 
         n_mix = gmm_params['nMix']
         covariance_type = gmm_params['covarianceType']
@@ -135,15 +167,15 @@ class GMMHMMTrainer(BaseTrainer):
         else:
             for gmm in gmms:
                 gmm_obj = GMM(n_components=gmm['nComponent'], covariance_type=gmm['covarianceType'])
-                gmm_obj.covars_ = np.array(gmm['covars'])
-                gmm_obj.means_ = np.array(gmm['means'])
-                gmm_obj.weights_ = np.array(gmm['weights'])
+                gmm_obj.covars_ = np.array(gmm['covars'], dtype=float)
+                gmm_obj.means_ = np.array(gmm['means'], dtype=float)
+                gmm_obj.weights_ = np.array(gmm['weights'], dtype=float)
                 gmm_obj_list.append(gmm_obj)
 
-        self.gmmhmm = GMMHMM(n_components=n_component, n_mix=n_mix, gmms=gmm_obj_list,
-                             n_iter=n_iter, covariance_type=covariance_type,
-                             transmat=transmat, transmat_prior=transmat_prior,
-                             startprob=startprob, startprob_prior=startprob_prior)
+        self.gmmhmm = PackedGMMHMM(n_components=n_component, n_mix=n_mix, gmms=gmm_obj_list,
+                                   n_iter=n_iter, covariance_type=covariance_type,
+                                   transmat=transmat, transmat_prior=transmat_prior,
+                                   startprob=startprob, startprob_prior=startprob_prior)
 
     def __repr__(self):
         return '<GMMHMMTrainer instance>\n\tinit_models:%s\n\tparams:%s\n\ttrain_data:%s' % (self._model,
@@ -158,9 +190,9 @@ class GMMHMMTrainer(BaseTrainer):
             gmms_.append({
                 'nComponent': gmm.n_components,
                 'nIter': gmm.n_iter,
-                'means': gmm.means_.tolist(),
-                'covars': gmm.covars_.tolist(),
-                'weights': gmm.weights_.tolist(),
+                'means': gmm.means_,
+                'covars': gmm.covars_,
+                'weights': gmm.weights_,
                 'covarianceType': gmm.covariance_type,
             })
         self.train_data_ += train_data.tolist()
@@ -168,10 +200,10 @@ class GMMHMMTrainer(BaseTrainer):
             'nIter': self.gmmhmm.n_iter,
             'hmmParams': {
                 'nComponent': self.gmmhmm.n_components,
-                'transMat': self.gmmhmm.transmat_.tolist(),
-                'transMatPrior': self.gmmhmm.transmat_prior.tolist(),
-                'startProb': self.gmmhmm.startprob_.tolist(),
-                'startProbPrior': self.gmmhmm.startprob_prior.tolist(),
+                'transMat': self.gmmhmm.transmat_,
+                'transMatPrior': self.gmmhmm.transmat_prior,
+                'startProb': self.gmmhmm.startprob_,
+                'startProbPrior': self.gmmhmm.startprob_prior,
             },
             'gmmParams': {
                 'nMix': self.gmmhmm.n_mix,
@@ -181,6 +213,102 @@ class GMMHMMTrainer(BaseTrainer):
         }
 
 
+class DiscreteHMMTrainer(BaseTrainer):
+    '''A wrapper to DiscreteHMM
+
+    Params look like GMMHMM's, with 'emissionParams' in place of 'gmmParams':
+      {'nIter': 50,
+       'hmmParams': {'nComponent', 'transMat', 'transMatPrior', 'startProb', 'startProbPrior'},
+       'emissionParams': {'rawdataType': ['motion', 'location', 'sound'], 'nSymbols': [6, 200, 18],
+                          'emissionPrior': 0.01, 'emissionLogProbs': optional, log table of every rawdata type}}
+
+    Attributes
+    ----------
+    _model: init params
+    discretehmm: DiscreteHMM instance
+    params_: params after fit
+    train_data_: current train datas
+    '''
+
+    def __init__(self, _model):
+        super(DiscreteHMMTrainer, self).__init__(_model)
+
+        hmm_params = _model['hmmParams']
+        emission_params = _model['emissionParams']
+        n_iter = _model.get('nIter', 50)
+
+        emissionlogprobs = emission_params.get('emissionLogProbs', None)
+        init_params = string.ascii_letters
+        if emissionlogprobs:
+            # Train on from the given tables
+            init_params = init_params.replace('e', '')
+        else:
+            emissionlogprobs = None
+
+        self.rawdata_type = emission_params.get('rawdataType', list(Dataset.rawdata_type))
+        self.discretehmm = DiscreteHMM(n_components=hmm_params['nComponent'],
+                                       n_symbols=emission_params['nSymbols'],
+                                       emissionlogprobs=emissionlogprobs,
+                                       emission_prior=emission_params.get('emissionPrior', 1e-2),
+                                       n_iter=n_iter, init_params=init_params,
+                                       transmat=np.array(hmm_params['transMat'], dtype=float),
+                                       transmat_prior=np.array(hmm_params['transMatPrior'], dtype=float),
+                                       startprob=np.array(hmm_params['startProb'], dtype=float),
+                                       startprob_prior=np.array(hmm_params['startProbPrior'], dtype=float))
+
+    @staticmethod
+    def defaultParams(status_sets, hmm_params=None):
+        '''Init params of an event from the system status sets, for events whose Config has none
+
+        Parameters
+        ----------
+        status_sets: dict, e.g. {'motion': [...], 'location': [...], 'sound': [...]}
+        hmm_params: dict, optional, e.g. the 'hmmParams' of the event's GMMHMM init params,
+          defaults to 4 hidden states with uniform start & transition probabilities
+        '''
+        if hmm_params is None:
+            n_component = 4
+            startprob = [1.0 / n_component] * n_component
+            transmat = [[1.0 / n_component] * n_component for _ in range(n_component)]
+            hmm_params = {'nComponent': n_component, 'startProb': startprob, 'startProbPrior': startprob,
+                          'transMat': transmat, 'transMatPrior': transmat}
+        return {
+            'nIter': 50,
+            'hmmParams': hmm_params,
+            'emissionParams': {
+                'rawdataType': list(Dataset.rawdata_type),
+                'nSymbols': [len(status_sets[rawdata_type]) for rawdata_type in Dataset.rawdata_type],
+                'emissionPrior': 1e-2,
+            }
+        }
+
+    def __repr__(self):
+        return '<DiscreteHMMTrainer instance>\n\tinit_models:%s\n\tparams:%s\n\ttrain_data:%s' % (self._model,
+                                                                                             self.params_, self.train_data_)
+
+    def fit(self, train_data):
+        train_data = [np.asarray(seq, dtype=int) for seq in train_data]
+        self.discretehmm.fit(train_data)
+
+        self.train_data_ += [seq.tolist() for seq in train_data]
+        self.params_ = {
+            'nIter': self.discretehmm.n_iter,
+            'hmmParams': {
+                'nComponent': self.discretehmm.n_components,
+                'transMat': self.discretehmm.transmat_,
+                'transMatPrior': self.discretehmm.transmat_prior,
+                'startProb': self.discretehmm.startprob_,
+                'startProbPrior': self.discretehmm.startprob_prior,
+            },
+            'emissionParams': {
+                'rawdataType': self.rawdata_type,
+                'nSymbols': self.discretehmm.n_symbols,
+                'emissionPrior': self.discretehmm.emission_prior,
+                'emissionLogProbs': list(self.discretehmm.emissionlogprobs_),
+            }
+        }
+
+
 if __name__ == '__main__':
     from datasets import Dataset
     d = Dataset()
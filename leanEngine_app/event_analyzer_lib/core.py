@@ -2,18 +2,44 @@
 
 from dao.config import *
 from dao.model import *
+from dao.model import Model_Load_Stats
 from algo.datasets import Dataset
 import datetime
 import logging
-import json
+import time
+import hashlib
+from gevent.event import AsyncResult
 from algo import trainer, classifier
 from algo.rnnrbm import Comparator
+from algo.procpool import mapInProcesses, jobErrorMessage
+from session import SessionStore, StreamSessionError
+from dao.cache import LRUCache
+from dao.codec import decodeParams
+from dao.snapshot import writeSnapshot, readSnapshot
+from dao.settings import MODEL_CACHE_MAX_TAGS
+from algo.paramstore import paramStorePath, writeParamStore, readParamStore
+from settings import STREAM_SESSION_TTL, STREAM_SESSION_MAX, MODEL_STORE_DIR, PREDICT_CACHE_SIZE, \
+    TRAIN_POOL_SIZE, CODEC_CACHE_MAX
 
 
 logger = logging.getLogger('logentries')
 
 
-ALGOMAP = {'GMMHMM': trainer.GMMHMMTrainer}  # algo_type to trainer class map
+ALGOMAP = {'GMMHMM': trainer.GMMHMMTrainer,
+           'DiscreteHMM': trainer.DiscreteHMMTrainer}  # algo_type to trainer class map
+CLASSIFIERMAP = {'GMMHMM': classifier.GMMHMMClassifier,
+                 'DiscreteHMM': classifier.DiscreteHMMClassifier}  # algo_type to classifier class map
+
+# Store ready-to-score classifiers in memory, keys are (algo_type, tag),
+# values are dict {'classifier': instance, 'version': version stamp of the tag's models}
+Classifier_In_Memory = LRUCache(MODEL_CACHE_MAX_TAGS)
+# Classifier lookups in flight, keys are (algo_type, tag), values are AsyncResult of the entry
+Classifier_Building = {}
+# Store predict results in memory, keys are (algo_type, tag, model version, digest of the encoded seq)
+Predict_Result_Cache = LRUCache(PREDICT_CACHE_SIZE)
+Predict_Cache_Stats = {'hits': 0, 'misses': 0}
+# Store streaming predict sessions in memory, keys are session ids
+Stream_Sessions = SessionStore(STREAM_SESSION_TTL, STREAM_SESSION_MAX)
 
 
 def rebuildEvent(
@@ -21,17 +47,41 @@ def rebuildEvent(
         algo_type="GMMHMM",
         new_tag="TAG_%s" % datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
 ):
+    model = _initModel(event_type, algo_type, new_tag)
+    if model is None:
+        return None
+    model_id = setModel(**model)
+    invalidateTag(algo_type, new_tag)
+    return model_id
+
+
+def _initModel(event_type, algo_type, new_tag):
+    '''Init model of event_type as setModel's keyword arguments, None if there is no such event
+    '''
     # Get events' info from db.
     events = getEventInfo()
+    if event_type not in events:
+        # May have been added since the config snapshot was loaded
+        refreshConfigSnapshot()
+        events = getEventInfo()
     # Validation of existance of the event
     if event_type not in events:
         logger.debug("There is no event named %s in Config Class" % event_type)
         return None
 
-    # Get Model's init params.
-    init_params = events[event_type]["initParams"][algo_type]
     # # Get Sets of all kinds of status classification.
     sys_status_sets = getSystemStatusSets()
+    # Get Model's init params.
+    event_init_params = events[event_type]["initParams"]
+    if algo_type in event_init_params:
+        init_params = event_init_params[algo_type]
+    elif hasattr(ALGOMAP[algo_type], 'defaultParams'):
+        # Derived from the status sets, reusing the hidden states setting of GMMHMM if any
+        gmmhmm_params = event_init_params.get('GMMHMM')
+        init_params = ALGOMAP[algo_type].defaultParams(sys_status_sets,
+                                                       gmmhmm_params['hmmParams'] if gmmhmm_params else None)
+    else:
+        raise KeyError(algo_type)
 
     logger.debug("Event %s's params is %s" % (event_type, init_params))
     logger.debug("And latest status classification are %s" % sys_status_sets)
@@ -39,18 +89,27 @@ def rebuildEvent(
 
     now = datetime.datetime.now()
     description = "Initiation of A new %s Model for event %s was made at %s" % (algo_type, event_type, now)
-    return setModel(algo_type=algo_type, model_tag=new_tag, event_type=event_type,
-                    model_param=init_params, status_sets=sys_status_sets, timestamp=now, description=description)
+    return dict(algo_type=algo_type, model_tag=new_tag, event_type=event_type,
+                model_param=init_params, status_sets=sys_status_sets, timestamp=now, description=description)
 
 
 def initAll(new_tag, algo_type):
+    '''Init models of all events, saved in batches
+
+    Returns
+    -------
+    result: dict
+      {'ids': {eventType: model id}, 'failures': {eventType: error message}}
+    '''
     # Get events' info from db.
+    refreshConfigSnapshot()
     events = getEventInfo()
 
-    for event in events:
-        rebuildEvent(event, algo_type, new_tag)
+    models = [_initModel(event, algo_type, new_tag) for event in events]
+    ids, failures = setModels(models)
+    invalidateTag(algo_type, new_tag)
 
-    return True
+    return {'ids': ids, 'failures': failures}
 
 
 def trainEvent(observations, event_type, source_tag, target_tag, algo_type):
@@ -74,8 +133,10 @@ def trainEvent(observations, event_type, source_tag, target_tag, algo_type):
     description = '[source_tag=%s]Train model algo_type=%s for eventType=%s' % (
         source_tag, algo_type, event_type)
 
-    return setModel(algo_type, target_tag, event_type, my_trainer.params_, status_sets,
-                    datetime.datetime.now(), description, json.dumps(observations))
+    model_id = setModel(algo_type, target_tag, event_type, my_trainer.params_, status_sets,
+                        datetime.datetime.now(), description, observations)
+    invalidateTag(algo_type, target_tag)
+    return model_id
 
 
 def trainEventRandomly(
@@ -86,6 +147,28 @@ def trainEventRandomly(
         obs_count,
         algo_type="GMMHMM"
 ):
+    model = _trainModelRandomly(event_type, source_tag, target_tag, obs_len, obs_count, algo_type)
+    model_id = setModel(**model)
+    invalidateTag(algo_type, target_tag)
+    return model_id
+
+
+def _trainModelRandomly(event_type, source_tag, target_tag, obs_len, obs_count, algo_type):
+    '''Randomly trained model of event_type as setModel's keyword arguments
+    '''
+    model, dataset = _randomTrainJob(event_type, source_tag, target_tag, obs_len, obs_count, algo_type)
+    model.update(model_param=_fitModel((algo_type, model['model_param'], dataset)), timestamp=datetime.datetime.now())
+    return model
+
+
+def _randomTrainJob(event_type, source_tag, target_tag, obs_len, obs_count, algo_type):
+    '''Random observations of event_type to train on
+
+    Returns
+    -------
+    model: dict, setModel's keyword arguments, model_param is still the source model's
+    dataset: numerical observations for the trainer
+    '''
     logger.info('[trainEventRandomly] event_type=%s, source_tag=%s, target_tag=%s'
                 % (event_type, source_tag, target_tag))
     model = getModel(algo_type, source_tag, event_type)
@@ -107,12 +190,22 @@ def trainEventRandomly(
 
     description = '[source_tag=%s]Random train algo_type=%s for eventType=%s, random train obs_len=%s, obs_count=%s' % (
         source_tag, algo_type, event_type, train_obs_len, train_obs_count)
+
+    return dict(algo_type=algo_type, model_tag=target_tag, event_type=event_type, model_param=model_param,
+                status_sets=status_sets, timestamp=None, description=description,
+                last_train_data=observations), d.getDataset()
+
+
+def _fitModel(job):
+    '''Fit a trainer of algo_type from model_param on dataset, returns the trained params
+
+    Only CPU work, it runs in a child process of mapInProcesses.
+    '''
+    algo_type, model_param, dataset = job
     TRAINER = ALGOMAP[algo_type]
     my_trainer = TRAINER(model_param)
-    my_trainer.fit(d.getDataset())
-
-    return setModel(algo_type, target_tag, event_type, my_trainer.params_, status_sets,
-                    datetime.datetime.now(), description, json.dumps(observations))
+    my_trainer.fit(dataset)
+    return my_trainer.params_
 
 def trainRandomRnnRBM():
 
@@ -152,8 +245,8 @@ def trainRandomRnnRBM():
     #     return temp_dict
 
     cmptor = Comparator(senz_len=senz_len,event_list=event_list)
-    params_dict = cmptor.fit(event_dict)
-    ids = save_rnnrbm_params(params_dict=params_dict,
+    params_dict = cmptor.fit(event_dict, processes=TRAIN_POOL_SIZE)
+    ids, failures = save_rnnrbm_params(params_dict=params_dict,
                              base_set_dict=dict(
                                  motion=motion_set,
                                  location_two=location_two_set,
@@ -161,7 +254,10 @@ def trainRandomRnnRBM():
                                  sound=sound_set
                              ),
                              tag="random_v0")
+    failures.update(cmptor.failures_)
     print "The ids saved  in leancloud are",ids
+    if failures:
+        print "The events failed to train or save are",failures
     print "observations event dict start"
     for i in event_dict:
         print i
@@ -225,15 +321,257 @@ def predictByRnnRbm(seq=None):
 
 
 def trainAll(source_tag, target_tag, obs_len, obs_count, algo_type):
-    '''train randomly all
+    '''train randomly all, events are fitted in TRAIN_POOL_SIZE child processes at a time, models are saved in batches
+
+    Returns
+    -------
+    result: dict
+      {'ids': {eventType: model id}, 'failures': {eventType: error message}}, events failed to train or save
+      are in failures, the others are saved
     '''
     # Get events' info from db.
     events = getEventInfo()
 
+    # Models and observations are loaded here, only fitting runs in TRAIN_POOL_SIZE child processes at a time,
+    # an event failing doesn't stop the others
+    failures = {}
+    jobs = []
     for event in events:
-        trainEventRandomly(event, source_tag, target_tag, obs_len, obs_count, algo_type)
+        try:
+            jobs.append(_randomTrainJob(event, source_tag, target_tag, obs_len, obs_count, algo_type))
+        except Exception, e:
+            logger.exception('[trainAll] eventType=%s failed: %s' % (event, e))
+            failures[event] = jobErrorMessage(e)
+    results = mapInProcesses(_fitModel, [(algo_type, model['model_param'], dataset) for model, dataset in jobs],
+                             TRAIN_POOL_SIZE)
+    now = datetime.datetime.now()
+    models = []
+    for (model, _), (param, error) in zip(jobs, results):
+        if error is None:
+            models.append(dict(model, model_param=param, timestamp=now))
+        else:
+            logger.error('[trainAll] eventType=%s failed: %s' % (model['event_type'],
+                                                                 getattr(error, 'traceback', None) or error))
+            failures[model['event_type']] = jobErrorMessage(error)
+    ids, save_failures = setModels(models)
+    failures.update(save_failures)
+    invalidateTag(algo_type, target_tag)
+
+    return {'ids': ids, 'failures': failures}
+
 
-    return True
+def getClassifier(algo_type, tag, x_request_id=''):
+    '''返回指定 algo_type 和 tag 的 classifier, 只在 tag 的 models 变化时重新构建
+
+    With MODEL_STORE_DIR set, classifiers supporting `pack` are served from the
+    tag's param store file mapped read-only, the file is written by the first
+    worker that loads the tag's current version.
+
+    Parameters
+    ----------
+    algo_type: string
+    tag: string
+
+    Returns
+    -------
+    classifier: instance of CLASSIFIERMAP[algo_type]
+    '''
+    return _getClassifierEntry(algo_type, tag, x_request_id)['classifier']
+
+
+def _getClassifierEntry(algo_type, tag, x_request_id=''):
+    '''Entry of the classifier of the tag's current models, {'classifier': instance, 'version': version stamp}
+
+    Only one lookup runs per (algo_type, tag) at a time: the version check, and on a miss the model fetch,
+    the classifier build and the param store write. Concurrent requests wait on its result and get its
+    exception if it fails.
+    '''
+    key = (algo_type, tag)
+    building = Classifier_Building.get(key)
+    if building is not None:
+        Model_Load_Stats['coalesced'] += 1
+        return building.get()
+
+    building = AsyncResult()
+    Classifier_Building[key] = building
+    try:
+        entry = _loadClassifierEntry(algo_type, tag, x_request_id)
+    except Exception, e:
+        building.set_exception(e)
+        raise
+    else:
+        building.set(entry)
+    finally:
+        if Classifier_Building.get(key) is building:
+            Classifier_Building.pop(key)
+    return entry
+
+
+def _loadClassifierEntry(algo_type, tag, x_request_id=''):
+    key = (algo_type, tag)
+    version = getModelVersionByTag(algo_type, tag)
+    entry = Classifier_In_Memory.get(key)
+    if entry is not None and entry['version'] == version:
+        return entry
+    if entry is not None:
+        _dropPredictResults(algo_type, tag)
+
+    CLASSIFER = CLASSIFIERMAP[algo_type]
+    use_store = bool(MODEL_STORE_DIR) and hasattr(CLASSIFER, 'from_packed')
+    classifier = None
+    if use_store and version is not None:
+        path = paramStorePath(MODEL_STORE_DIR, algo_type, tag)
+        store_version, items = readParamStore(path)
+        if store_version == version:
+            logger.info('<%s>, [get classifier] map param store of tag:%s' % (x_request_id, tag))
+            classifier = CLASSIFER.from_packed(items, max_codecs=CODEC_CACHE_MAX)
+
+    if classifier is None:
+        logger.info('<%s>, [get classifier] start get Model by tag:%s' % (x_request_id, tag))
+        models = {}
+        for model in getModelByTag(algo_type, tag):
+            models[model.get('eventType')] = {'status_set': model.get('statusSets'),
+                                                'param': decodeParams(model.get('param'))}
+        logger.info('<%s>, [get classifier] end get Model by tag:%s' % (x_request_id, tag))
+
+        if not models or len(models) == 0:
+            logger.error("<%s>, [get classifier] tag=%s don't have models" % (x_request_id, tag))
+            raise ValueError("tag=%s don't have models" % (tag))
+
+        # Stamp of the models just fetched
+        version = getModelVersionByTag(algo_type, tag)
+        classifier = CLASSIFER(models, max_codecs=CODEC_CACHE_MAX)
+        if use_store:
+            path = paramStorePath(MODEL_STORE_DIR, algo_type, tag)
+            try:
+                writeParamStore(path, version, classifier.pack())
+                store_version, items = readParamStore(path)
+            except (IOError, OSError), e:
+                logger.error('<%s>, [get classifier] write param store of tag:%s failed: %s' % (x_request_id, tag, e))
+            else:
+                # Serve from the mapped file and drop the private copies of the params
+                if store_version == version:
+                    classifier = CLASSIFER.from_packed(items, max_codecs=CODEC_CACHE_MAX)
+                    releaseModelsByTag(algo_type, tag)
+
+    entry = {'classifier': classifier, 'version': version}
+    Classifier_In_Memory.set(key, entry)
+    return entry
+
+
+def preload(targets, x_request_id=''):
+    '''Build the classifiers of `targets` ahead of the first predict
+
+    Parameters
+    ----------
+    targets: list of tuple (algo_type, tag)
+
+    Returns
+    -------
+    failed: list of tuple (algo_type, tag)
+      targets that could not be loaded, the rest are in Classifier_In_Memory
+    '''
+    start = time.time()
+    failed = []
+    for algo_type, tag in targets:
+        target_start = time.time()
+        try:
+            getClassifier(algo_type, tag, x_request_id)
+        except Exception, e:
+            logger.exception('<%s>, [preload] algo_type=%s, tag=%s failed: %s' % (x_request_id, algo_type, tag, e))
+            failed.append((algo_type, tag))
+        else:
+            logger.info('<%s>, [preload] algo_type=%s, tag=%s loaded in %.3fs'
+                        % (x_request_id, algo_type, tag, time.time() - target_start))
+    logger.info('<%s>, [preload] %d/%d targets loaded in %.3fs'
+                % (x_request_id, len(targets) - len(failed), len(targets), time.time() - start))
+    return failed
+
+
+def exportTag(algo_type, tag, path):
+    '''Write every model of `tag`, its status sets and version stamp to one checksummed snapshot file
+
+    Returns
+    -------
+    header: dict
+      e.g. {"algoType": "GMMHMM", "tag": "random_train", "version": ..., "models": 12, "sha256": ..., ...}
+    '''
+    models = getModelByTag(algo_type, tag)
+    if not models:
+        raise ValueError("tag=%s don't have models" % (tag))
+    # Stamp of the models just fetched
+    version = getModelVersionByTag(algo_type, tag)
+    header = writeSnapshot(path, {'algoType': algo_type, 'tag': tag, 'version': version,
+                                  'exportedAt': datetime.datetime.utcnow().isoformat()},
+                           [{'eventType': model.get('eventType'), 'statusSets': model.get('statusSets'),
+                             'param': model.get('param')} for model in models])
+    logger.info('[exportTag] algo_type=%s, tag=%s, %d models exported to %s' % (algo_type, tag, len(models), path))
+    return header
+
+
+def importTag(path, pinned=False, x_request_id=''):
+    '''Load the classifier of a snapshot written by exportTag, without any query
+
+    The classifier is served for the snapshot's version stamp. Once MODEL_CACHE_TTL expires the
+    stamp is checked against the database as usual, unless `pinned`, then the snapshot is served
+    until the tag is invalidated (e.g. to run while LeanCloud is unreachable), and is not evicted
+    by the MODEL_CACHE_MAX_TAGS bound.
+
+    Returns
+    -------
+    header: dict, see exportTag
+    '''
+    header, models = readSnapshot(path)
+    algo_type, tag, version = header['algoType'], header['tag'], header['version']
+    classifier = CLASSIFIERMAP[algo_type](dict((model['eventType'], {'status_set': model['statusSets'],
+                                                                     'param': model['param']})
+                                               for model in models), max_codecs=CODEC_CACHE_MAX)
+    _dropPredictResults(algo_type, tag)
+    seedModelVersion(algo_type, tag, version, pinned=pinned)
+    Classifier_In_Memory.set((algo_type, tag), {'classifier': classifier, 'version': version}, pinned=pinned)
+    logger.info('<%s>, [importTag] algo_type=%s, tag=%s, version=%s, %d models imported from %s'
+                % (x_request_id, algo_type, tag, version, len(models), path))
+    return header
+
+
+def invalidateTag(algo_type, tag):
+    '''Drop the cached models and classifier of `tag`, call it after saving a model under the tag
+    '''
+    invalidateModelByTag(algo_type, tag)
+    Classifier_In_Memory.pop((algo_type, tag), None)
+    Classifier_Building.pop((algo_type, tag), None)
+    _dropPredictResults(algo_type, tag)
+
+
+def getPredictCacheStats():
+    '''返回本 worker 的 predict 结果缓存统计
+
+    Returns
+    -------
+    stats: dict
+      e.g. {"hits": 90, "misses": 10, "size": 10}
+    '''
+    stats = dict(Predict_Cache_Stats)
+    stats['size'] = len(Predict_Result_Cache)
+    return stats
+
+
+def _dropPredictResults(algo_type, tag):
+    for key in Predict_Result_Cache.keys():
+        if key[:2] == (algo_type, tag):
+            Predict_Result_Cache.pop(key)
+
+
+def _encodedDigest(seqs_converted):
+    '''Digest of a seq converted by a classifier's `encode`
+    '''
+    digest = hashlib.md5()
+    for fingerprint in sorted(seqs_converted):
+        encoded = seqs_converted[fingerprint]
+        digest.update(repr(fingerprint))
+        digest.update(str(encoded.shape))
+        digest.update(encoded.tostring())
+    return digest.hexdigest()
 
 
 def predictEvent(seq, tag, algo_type, x_request_id=''):
@@ -250,27 +588,104 @@ def predictEvent(seq, tag, algo_type, x_request_id=''):
     predict_result: dict
       e.g. {"shopping": 0.7, "sleeping": 0.3}
     '''
-    algo_type2classifer_map = {"GMMHMM": classifier.GMMHMMClassifier}
-
-    logger.info('<%s>, [predict event] start get Model by tag:%s' % (x_request_id, tag))
-    models = {}
-    for model in getModelByTag(algo_type, tag):
-        models[model.get('eventType')] = {'status_set': model.get('statusSets'), 'param': model.get('param')}
-    logger.info('<%s>, [predict event] end get Model by tag:%s' %(x_request_id, tag))
-
-    if not models or len(models) == 0:
-        logger.error("<%s>, [predict event] tag=%s don't have models" % (x_request_id, tag))
-        raise ValueError("tag=%s don't have models" % (tag))
+    classifier_entry = _getClassifierEntry(algo_type, tag, x_request_id)
+    my_classifer = classifier_entry['classifier']
 
     logger.info('<%s>, [predict event] start predict, seq=%s' % (x_request_id, seq))
-    CLASSIFER = algo_type2classifer_map[algo_type]
-    my_classifer = CLASSIFER(models)
-    predict_result = my_classifer.predict(seq)
+    if PREDICT_CACHE_SIZE <= 0:
+        predict_result = my_classifer.predict(seq)
+    else:
+        seqs_converted = my_classifer.encode(seq)
+        cache_key = (algo_type, tag, classifier_entry['version'], _encodedDigest(seqs_converted))
+        predict_result = Predict_Result_Cache.get(cache_key)
+        if predict_result is not None:
+            Predict_Cache_Stats['hits'] += 1
+        else:
+            Predict_Cache_Stats['misses'] += 1
+            predict_result = my_classifer.predict_encoded(seqs_converted)
+            Predict_Result_Cache.set(cache_key, predict_result)
+        # callers own the returned dict
+        predict_result = dict(predict_result)
     logger.info('<%s>, [predict event] end predict, seq=%s, predict_result=%s' %(x_request_id, seq, predict_result))
 
     return predict_result
 
 
+def predictEventStream(session_id, seq, tag, algo_type, reset=False, offset=0, x_request_id=''):
+    '''session下到目前为止的整个seq最可能属于一个tag下哪个label的model
+
+    Only the new senz items in `seq` are scored, the forward states of every label
+    are carried on from the previous call of the same session. A session keeps the
+    classifier it started with until it is reset or expires.
+
+    Sessions are kept per process, `offset` tells whether this process holds the
+    session the client continues. offset 0 (or reset) starts the session over,
+    otherwise the session here must have scored exactly `offset` items, else
+    StreamSessionError is raised and nothing is scored.
+
+    Parameters
+    ----------
+    session_id: string
+    seq: list, senz items appended since the previous call
+    tag: string
+    algo_type: string
+    reset: bool, start the session over, seq is then the whole seq
+    offset: int, items of the session sent before this call
+
+    Returns
+    -------
+    predict_result: dict, same as predictEvent of the whole seq so far
+      e.g. {"shopping": 0.7, "sleeping": 0.3}
+    seq_length: int, length of the whole seq so far
+    '''
+    session = None if reset or offset == 0 else Stream_Sessions.get(session_id)
+    if session is not None and session['key'] != (algo_type, tag):
+        session = None
+    if not reset and offset != 0:
+        seq_length = session['seq_length'] if session is not None else 0
+        if seq_length != offset:
+            logger.info('<%s>, [predict event stream] session:%s has %s items here, request offset=%s'
+                        % (x_request_id, session_id, seq_length, offset))
+            raise StreamSessionError(session_id, offset, seq_length)
+    if session is None:
+        logger.info('<%s>, [predict event stream] new session:%s, tag:%s' % (x_request_id, session_id, tag))
+        session = {'key': (algo_type, tag), 'classifier': getClassifier(algo_type, tag, x_request_id),
+                   'states': None, 'seq_length': 0}
+
+    predict_result, session['states'] = session['classifier'].predict_stream(seq, session['states'])
+    session['seq_length'] += len(seq)
+    Stream_Sessions.set(session_id, session)
+    logger.info('<%s>, [predict event stream] session:%s, seq_length=%s, predict_result=%s'
+                % (x_request_id, session_id, session['seq_length'], predict_result))
+
+    return predict_result, session['seq_length']
+
+
+def predictEvents(seqs, tag, algo_type, x_request_id=''):
+    '''seqs中每个seq最可能属于一个tag下哪个label的model
+
+    Models of `tag` are loaded once for all seqs.
+
+    Parameters
+    ----------
+    seqs: list of seq
+    tag: string
+    algo_type: string
+
+    Returns
+    -------
+    predict_results: list of dict, one for each seq in `seqs`
+      e.g. [{"shopping": 0.7, "sleeping": 0.3}, {"shopping": 0.2, "sleeping": 0.8}]
+    '''
+    my_classifer = getClassifier(algo_type, tag, x_request_id)
+
+    logger.info('<%s>, [predict events] start predict, seqs count=%s' % (x_request_id, len(seqs)))
+    predict_results = my_classifer.predict_batch(seqs)
+    logger.info('<%s>, [predict events] end predict, seqs count=%s' % (x_request_id, len(seqs)))
+
+    return predict_results
+
+
 
 if __name__ == "__main__":
 
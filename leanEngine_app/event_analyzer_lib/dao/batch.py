@@ -0,0 +1,76 @@
+# coding: utf-8
+
+__all__ = ["saveAll"]
+
+from leancloud import client, utils
+from leancloud import LeanCloudError
+from settings import BATCH_SAVE_SIZE
+import logging
+
+logger = logging.getLogger('logentries')
+
+
+def saveAll(objects, chunk_size=BATCH_SAVE_SIZE):
+    '''
+    批量保存 leancloud Object, 每 chunk_size 个一次 /batch 请求
+
+    Unlike Object.save, a failed object doesn't stop the others, its error is returned.
+    Only flat objects are supported, pointers to unsaved objects are not saved first.
+
+    Parameters
+    ----------
+    objects: list of leancloud Object
+    chunk_size: int, objects per request
+
+    Returns
+    -------
+    results: list of tuple (object_id, error), one for each object in `objects`
+      object_id is None when the object failed, error is None when it was saved
+    '''
+    results = []
+    for start in xrange(0, len(objects), chunk_size):
+        results += _saveChunk(objects[start:start + chunk_size])
+    return results
+
+
+def _saveChunk(objects):
+    requests = []
+    for obj in objects:
+        obj._start_save()
+        requests.append({
+            'method': 'POST' if obj.id is None else 'PUT',
+            'path': '/{0}/classes/{1}'.format(client.SERVER_VERSION, obj._class_name) +
+                    ('' if obj.id is None else '/' + obj.id),
+            'body': obj._dump_save(),
+        })
+
+    try:
+        response = utils.response_to_json(client.post('/batch', params={'requests': requests}))
+    except Exception, e:
+        logger.exception('[saveAll] batch of %d objects failed: %s' % (len(objects), e))
+        for obj in objects:
+            _cancelSave(obj)
+        return [(None, e) for _ in objects]
+
+    results = []
+    for obj, content in zip(objects, response):
+        if content.get('success') is None:
+            # {"error": {"code": 1, "error": "message"}}
+            error = content.get('error') or {}
+            error = LeanCloudError(error.get('code', 1), error.get('error', 'Unknown Error'))
+            _cancelSave(obj)
+            results.append((None, error))
+        else:
+            obj._finish_save(obj.parse(content['success']))
+            results.append((obj.id, None))
+    return results
+
+
+def _cancelSave(obj):
+    # Object._cancel_save of the sdk raises KeyError when a failed key has no newer change,
+    # put the failed changes back to the pending ones so that a later save still sends them.
+    failed_changes = obj._op_set_queue.pop(0)
+    next_changes = obj._op_set_queue[0]
+    for key, op in failed_changes.iteritems():
+        newer = next_changes.get(key)
+        next_changes[key] = newer._merge(op) if newer else op
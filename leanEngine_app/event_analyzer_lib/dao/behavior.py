@@ -1,14 +1,182 @@
-from leancloud import Object
-from leancloud import Query
+# coding: utf-8
+
+__all__ = ["saveUserBehavior", "flushUserBehaviors", "getBehaviorQueueStats", "BehaviorQueue"]
+
+from storage import getStorage
+from settings import BEHAVIOR_BATCH_SIZE, BEHAVIOR_FLUSH_INTERVAL, BEHAVIOR_QUEUE_MAX, BEHAVIOR_OVERFLOW, \
+    BEHAVIOR_RETRY_MAX, BEHAVIOR_RETRY_BACKOFF
+from collections import deque
+from gevent.event import Event
+from gevent.lock import Semaphore
+import gevent
+import logging
+import os
+import time
+
+logger = logging.getLogger('logentries')
+
+
+class BehaviorQueue(object):
+    '''Write-behind buffer of Behavior rows
+
+    Rows are queued by put and saved in batches of batch_size by a writer greenlet,
+    once batch_size rows are waiting or flush_interval seconds after the oldest was queued.
+    A batch whose rows fail is retried up to retry_max times, sleeping retry_backoff seconds
+    doubled on each retry, then the failed rows are dropped.
+
+    overflow decides what put does when max_size rows are waiting:
+      'drop_oldest': drop the oldest waiting row, 'drop_newest': drop the row being put,
+      'block': wait until the writer makes room
+    '''
+
+    OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+    def __init__(self, class_name='Behavior', batch_size=BEHAVIOR_BATCH_SIZE, flush_interval=BEHAVIOR_FLUSH_INTERVAL,
+                 max_size=BEHAVIOR_QUEUE_MAX, overflow=BEHAVIOR_OVERFLOW, retry_max=BEHAVIOR_RETRY_MAX,
+                 retry_backoff=BEHAVIOR_RETRY_BACKOFF):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError('overflow must be one of %s' % (', '.join(self.OVERFLOW_POLICIES)))
+        self.class_name = class_name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_size = max_size
+        self.overflow = overflow
+        self.retry_max = retry_max
+        self.retry_backoff = retry_backoff
+        self.stats = {'queued': 0, 'saved': 0, 'dropped': 0, 'failed': 0}
+        self._rows = deque()
+        self._oldest_at = None
+        self._wake = Event()
+        self._room = Event()
+        self._saving = Semaphore()
+        self._writer = None
+        self._pid = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def put(self, row):
+        '''Queue a row, returns False if it was dropped by the overflow policy
+        '''
+        while len(self._rows) >= self.max_size:
+            if self.overflow == 'drop_newest':
+                self.stats['dropped'] += 1
+                return False
+            if self.overflow == 'drop_oldest':
+                self._rows.popleft()
+                self.stats['dropped'] += 1
+                break
+            self._room.clear()
+            self._wake.set()
+            self._room.wait()
+
+        if not self._rows:
+            self._oldest_at = time.time()
+        self._rows.append(row)
+        self.stats['queued'] += 1
+        self._startWriter()
+        if len(self._rows) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def flush(self):
+        '''Save every queued row now, e.g. on shutdown, returns the number of rows saved
+        '''
+        saved = 0
+        while self._rows:
+            saved += self._saveBatch()
+        return saved
+
+    def _startWriter(self):
+        # A writer of the parent process doesn't run in a forked child
+        if self._writer is None or self._writer.dead or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._writer = gevent.spawn(self._run)
+
+    def _run(self):
+        while True:
+            if self._oldest_at is None:
+                timeout = self.flush_interval
+            else:
+                timeout = max(0, self._oldest_at + self.flush_interval - time.time())
+            self._wake.wait(timeout)
+            self._wake.clear()
+            if not self._rows:
+                continue
+            full = len(self._rows) >= min(self.batch_size, self.max_size)
+            if full or time.time() - self._oldest_at >= self.flush_interval:
+                try:
+                    self._saveBatch()
+                except Exception, e:
+                    logger.exception('[BehaviorQueue] writer failed: %s' % (e))
+
+    def _saveBatch(self):
+        with self._saving:
+            rows = [self._rows.popleft() for _ in xrange(min(self.batch_size, len(self._rows)))]
+            self._oldest_at = time.time() if self._rows else None
+            self._room.set()
+            if not rows:
+                return 0
+
+            saved = 0
+            backoff = self.retry_backoff
+            for attempt in xrange(self.retry_max + 1):
+                try:
+                    results = getStorage().saveAll(self.class_name, rows)
+                except Exception, e:
+                    results = [(None, e)] * len(rows)
+                rows = [row for row, (_, error) in zip(rows, results) if error is not None]
+                saved += len(results) - len(rows)
+                if not rows:
+                    break
+                if attempt < self.retry_max:
+                    logger.warning('[BehaviorQueue] %d rows failed, retry in %ss' % (len(rows), backoff))
+                    gevent.sleep(backoff)
+                    backoff *= 2
+
+            self.stats['saved'] += saved
+            if rows:
+                logger.error('[BehaviorQueue] %d rows dropped after %d retries' % (len(rows), self.retry_max))
+                self.stats['failed'] += len(rows)
+            return saved
+
+
+# Behavior rows of this process waiting to be saved
+Behavior_Queue = BehaviorQueue()
 
-Behavior = Object.extend("Behavior")
 
 def saveUserBehavior(behavior_sequence, source, event_type, model_id, timestamp):
-    behavior = Behavior()
-    behavior.set("behaviorData", behavior_sequence)
-    behavior.set("source", source)
-    behavior.set("modelId", model_id)
-    behavior.set("eventType", event_type)
-    behavior.set("happenedAt", timestamp)
-    behavior.save()
-    return behavior.id
\ No newline at end of file
+    '''
+    异步保存 Behavior, 批量写入
+
+    Returns
+    -------
+    queued: bool, False if the row was dropped because the queue is full
+    '''
+    return Behavior_Queue.put({
+        "behaviorData": behavior_sequence,
+        "source": source,
+        "modelId": model_id,
+        "eventType": event_type,
+        "happenedAt": timestamp,
+    })
+
+
+def flushUserBehaviors():
+    '''Save every queued Behavior now, call it before the process exits
+    '''
+    return Behavior_Queue.flush()
+
+
+def getBehaviorQueueStats():
+    '''
+    返回 Behavior 队列的统计
+
+    Returns
+    -------
+    stats: dict
+      queued, saved, dropped (by the overflow policy), failed (after retries), waiting
+    '''
+    stats = dict(Behavior_Queue.stats)
+    stats['waiting'] = len(Behavior_Queue)
+    return stats
@@ -0,0 +1,56 @@
+# coding: utf-8
+
+__all__ = ["LRUCache"]
+
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    '''Bounded in-process cache evicting the least recently used entry
+
+    Entries set with pinned=True are never evicted and don't count against max_entries,
+    they stay until popped or cleared.
+
+    Attributes
+    ----------
+    max_entries: int, entries kept at most besides the pinned ones
+    _entries: OrderedDict, least recently used first
+    _pinned: set of pinned keys
+    '''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._pinned = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def keys(self):
+        return self._entries.keys()
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+        value = self._entries.pop(key)
+        self._entries[key] = value
+        return value
+
+    def set(self, key, value, pinned=False):
+        self._entries.pop(key, None)
+        self._entries[key] = value
+        if pinned:
+            self._pinned.add(key)
+        while len(self._entries) - len(self._pinned) > self.max_entries:
+            del self._entries[next(old_key for old_key in self._entries if old_key not in self._pinned)]
+
+    def pop(self, key, default=None):
+        self._pinned.discard(key)
+        return self._entries.pop(key, default)
+
+    def clear(self):
+        self._entries.clear()
+        self._pinned.clear()
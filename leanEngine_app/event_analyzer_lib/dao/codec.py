@@ -0,0 +1,128 @@
+__all__ = ["encodeArray", "decodeArray", "isEncodedArray", "encodeParams", "decodeParams", "encodeObservations",
+           "decodeObservations"]
+
+from settings import PARAM_FLOAT_DTYPE
+import numpy as np
+import base64
+import zlib
+
+# Version of the encoded array format, bumped when the layout changes
+PARAM_CODEC_VERSION = 1
+# Key marking an encoded array in the stored params, its value is the format version
+ENCODED_ARRAY_KEY = '__ndarray__'
+# Version of the encoded observations format
+OBSERVATIONS_CODEC_VERSION = 1
+
+
+def isEncodedArray(value):
+    return isinstance(value, dict) and ENCODED_ARRAY_KEY in value
+
+
+def encodeArray(array, float_dtype=PARAM_FLOAT_DTYPE):
+    '''Encode a ndarray as a JSON-able dict
+
+    Floating arrays are stored as float_dtype, other arrays keep their own dtype.
+
+    Returns
+    -------
+    encoded: dict
+      {'__ndarray__': version, 'dtype': little-endian dtype str, 'shape': list, 'data': base64 str of the buffer}
+    '''
+    array = np.asarray(array)
+    dtype = np.dtype(float_dtype) if array.dtype.kind == 'f' else array.dtype
+    dtype = dtype.newbyteorder('<')
+    array = np.ascontiguousarray(array, dtype=dtype)
+    return {
+        ENCODED_ARRAY_KEY: PARAM_CODEC_VERSION,
+        'dtype': dtype.str,
+        'shape': list(array.shape),
+        'data': base64.b64encode(array.tostring()),
+    }
+
+
+def decodeArray(encoded):
+    '''Decode an array encoded by encodeArray
+
+    The result is a read-only view on the decoded bytes, made by np.frombuffer without a copy.
+    '''
+    version = encoded[ENCODED_ARRAY_KEY]
+    if version > PARAM_CODEC_VERSION:
+        raise ValueError('encoded array version %s is newer than %s' % (version, PARAM_CODEC_VERSION))
+    array = np.frombuffer(base64.b64decode(encoded['data']), dtype=np.dtype(str(encoded['dtype'])))
+    return array.reshape(encoded['shape'])
+
+
+def encodeParams(params, float_dtype=PARAM_FLOAT_DTYPE):
+    '''Encode every ndarray in nested dicts / lists of params, other values are kept as they are
+    '''
+    if isinstance(params, np.ndarray):
+        return encodeArray(params, float_dtype)
+    if isinstance(params, dict):
+        return dict((key, encodeParams(value, float_dtype)) for key, value in params.iteritems())
+    if isinstance(params, (list, tuple)):
+        return [encodeParams(value, float_dtype) for value in params]
+    return params
+
+
+def decodeParams(params):
+    '''Decode every encoded array in nested dicts / lists of params
+
+    Rows saved before the binary encoding hold nested lists, they are returned as they are.
+    '''
+    if isinstance(params, dict):
+        if ENCODED_ARRAY_KEY in params:
+            return decodeArray(params)
+        return dict((key, decodeParams(value)) for key, value in params.iteritems())
+    if isinstance(params, list):
+        return [decodeParams(value) for value in params]
+    return params
+
+
+def encodeObservations(observations):
+    '''Encode observations as integer indexes into their own vocabularies, zlib compressed
+
+    Parameters
+    ----------
+    observations: list of seq, a seq is a list of senz dict, e.g. {'motion': 'sitting', 'sound': ..., 'location': ...}
+
+    Returns
+    -------
+    encoded: dict
+      {'version': int, 'rawdataType': list of senz keys, 'vocab': {key: list of values}, 'lengths': list of seq lengths,
+       'dtype': dtype str, 'data': base64 str of the zlib compressed (n_senzes, n_keys) index array, -1 for missing keys}
+    '''
+    lengths = [len(seq) for seq in observations]
+    rawdata_type = sorted(set(key for seq in observations for senz in seq for key in senz))
+    vocab = dict((key, sorted(set(senz[key] for seq in observations for senz in seq if key in senz)))
+                 for key in rawdata_type)
+    index = dict((key, dict((value, i) for i, value in enumerate(values))) for key, values in vocab.iteritems())
+    dtype = np.dtype('<i2') if max([len(values) for values in vocab.values()] + [0]) < 2 ** 15 else np.dtype('<i4')
+    data = np.array([[index[key][senz[key]] if key in senz else -1 for key in rawdata_type]
+                     for seq in observations for senz in seq], dtype=dtype).reshape(sum(lengths), len(rawdata_type))
+    return {
+        'version': OBSERVATIONS_CODEC_VERSION,
+        'rawdataType': rawdata_type,
+        'vocab': vocab,
+        'lengths': lengths,
+        'dtype': dtype.str,
+        'data': base64.b64encode(zlib.compress(data.tostring())),
+    }
+
+
+def decodeObservations(encoded):
+    '''Decode observations encoded by encodeObservations, a list of seq of senz dict
+    '''
+    if encoded['version'] > OBSERVATIONS_CODEC_VERSION:
+        raise ValueError('encoded observations version %s is newer than %s'
+                         % (encoded['version'], OBSERVATIONS_CODEC_VERSION))
+    rawdata_type = encoded['rawdataType']
+    vocab = encoded['vocab']
+    data = np.frombuffer(zlib.decompress(base64.b64decode(encoded['data'])), dtype=np.dtype(str(encoded['dtype'])))
+    data = data.reshape(sum(encoded['lengths']), len(rawdata_type)).tolist()
+    observations = []
+    start = 0
+    for length in encoded['lengths']:
+        observations.append([dict((key, vocab[key][i]) for key, i in zip(rawdata_type, row) if i >= 0)
+                             for row in data[start:start + length]])
+        start += length
+    return observations
@@ -1,25 +1,74 @@
-__all__ = ["getSystemStatusSets", "getEventInfo", "getEventList", "getEventProbMap","get_location_one_set","get_location_two_set","get_motion_set","get_sound_set"]
+# coding: utf-8
 
-from leancloud import Object
-from leancloud import Query
-from settings import configList
+__all__ = ["getSystemStatusSets", "getEventInfo", "getEventList", "getEventProbMap","get_location_one_set","get_location_two_set","get_motion_set","get_sound_set",
+           "getConfigSnapshot", "refreshConfigSnapshot"]
 
-Config = Object.extend("Config")
+from storage import getStorage
+from settings import configList, CONFIG_SNAPSHOT_TTL
+from gevent.event import AsyncResult
+import copy
+import logging
+import time
+
+logger = logging.getLogger('logentries')
+# Snapshot of every Config row, {'values': {name: value}, 'loadedAt': timestamp}, replaced as a whole on refresh
+Config_Snapshot = None
+# Snapshot load in flight, AsyncResult of the snapshot being loaded
+Config_Loading = []
 
 # Basic Function
 
+def getConfigSnapshot():
+    '''
+    返回所有 Config 的快照, 过期 (CONFIG_SNAPSHOT_TTL) 后重新加载
+
+    Returns
+    -------
+    snapshot: dict
+      {'values': {name: value}, 'loadedAt': timestamp}, shared, must not be modified
+    '''
+    snapshot = Config_Snapshot
+    if snapshot is not None and (CONFIG_SNAPSHOT_TTL is None or time.time() - snapshot['loadedAt'] <= CONFIG_SNAPSHOT_TTL):
+        return snapshot
+    return refreshConfigSnapshot()
+
+
+def refreshConfigSnapshot():
+    '''Reload the Config snapshot now, concurrent callers share one load
+    '''
+    global Config_Snapshot
+    if Config_Loading:
+        return Config_Loading[0].get()
+
+    loading = AsyncResult()
+    Config_Loading.append(loading)
+    try:
+        snapshot = {'values': _getConfigs_from_db(), 'loadedAt': time.time()}
+    except Exception, e:
+        loading.set_exception(e)
+        raise
+    else:
+        Config_Snapshot = snapshot
+        loading.set(snapshot)
+    finally:
+        Config_Loading.remove(loading)
+    return snapshot
+
+
+def _getConfigs_from_db():
+    '''All Config rows in one query of the storage, keys are names
+    '''
+    values = getStorage().getConfigs()
+    logger.info('[_getConfigs_from_db] loaded %d configs' % (len(values)))
+    return values
+
+
 def _getConfig(config_name):
-    query = Query(Config)
-    query.equal_to("name", config_name)
-    config_value = query.first().get("value")
-    return config_value
+    # A copy, the helpers and their callers may modify it
+    return copy.deepcopy(getConfigSnapshot()['values'][config_name])
 
 def _getConfigList():
-    query = Query(Config)
-    config_list = []
-    for config in query.find():
-        config_list.append(config.get("name"))
-    return config_list
+    return getConfigSnapshot()['values'].keys()
 
 
 # Advanced Function
@@ -66,7 +115,7 @@ def getEventInfo():
     # Get all events' info from db.
     events = _getConfig(configList[1])
     # Get rid of inactive event.
-    for event in events:
+    for event in events.keys():
         if events[event]["isActive"] is False:
             events.pop(event)
     return events
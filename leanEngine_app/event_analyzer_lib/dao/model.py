@@ -1,26 +1,39 @@
 # coding: utf-8
 
-__all__ = ["getModel", "setModel", "getModelByTag", "save_rnnrbm_params", "get_all_rnnrbm_params"]
-
-from leancloud import Object
-from leancloud import Query
-import gevent
+__all__ = ["getModel", "setModel", "setModels", "getModelByTag", "getModelVersionByTag", "invalidateModelByTag",
+           "releaseModelsByTag", "seedModelVersion", "getModelLoadStats", "getTrainData", "save_rnnrbm_params",
+           "get_all_rnnrbm_params"]
+
+from storage import getStorage
+from settings import MODEL_CACHE_MAX_TAGS, MODEL_CACHE_TTL, RNNRBM_CACHE_MAX
+from cache import LRUCache
+from codec import encodeParams, decodeParams, encodeObservations, decodeObservations
+from gevent.event import AsyncResult
+import numpy as np
 import logging
+import time
 
 logger = logging.getLogger('logentries')
-Model = Object.extend("Model")
-Rnnrbm = Object.extend("Rnnrbm")
-# Store models in memory
-Model_In_Memory = {}
+# Rows are kept in the classes Model, Rnnrbm and TrainData (observations a model was last trained on,
+# referenced by Model.lastTrainDataId) of the storage in use, see dao.storage
+# Store models in memory, keys are (algo_type, tag),
+# values are dict {'models': list of model objs or None, 'version': version stamp, 'checkedAt': timestamp},
+# models are None when only the version stamp was needed or the models were released,
+# entries seeded with 'pinned': True are never checked against the database
+Model_In_Memory = LRUCache(MODEL_CACHE_MAX_TAGS)
+# Loads in flight, keys are (algo_type, tag), values are AsyncResult of the entry being loaded
+Model_Loading = {}
+# Single-flight counters of this worker
+Model_Load_Stats = {'loads': 0, 'coalesced': 0}
+# Decoded Rnnrbm params, keys are (tag, eventType), tag None for the latest of any tag,
+# values are dict {'params': dict of ndarray, 'loadedAt': timestamp}
+Rnnrbm_In_Memory = LRUCache(RNNRBM_CACHE_MAX)
+# Columns of Model a tag load fetches, enough to score and stamp the version
+MODEL_SCORING_KEYS = ('eventType', 'statusSets', 'param', 'updatedAt')
 
 def getModel(algo_type, model_tag, event_type):
-    query = Query(Model)
-    query.equal_to("algoType", algo_type)
-    query.equal_to("tag", model_tag)
-    query.equal_to("eventType", event_type)
-    query.descending("timestamp")
-    model_info  = query.first()
-    model_param = model_info.get("param")
+    model_info  = getStorage().getLatestModel(algo_type, model_tag, event_type, keys=("param", "statusSets"))
+    model_param = decodeParams(model_info.get("param"))
     status_sets = model_info.get("statusSets")
     return {
         "modelParam": model_param,
@@ -33,30 +46,28 @@ def save_rnnrbm_params(params_dict, base_set_dict, tag="random_v0" ):
     :param params_dict:
     :param base_set_dict:
     :param tag:
-    :return:
+    :return: (ids, failures), dicts keyed by eventType of saved ids and error messages
     '''
     #try:
 
-    def ndarray_to_list_in_dict(params_dict):
-
-        new_params_dict ={}
-        for key, params in params_dict.items():
-            new_params_dict.update({key:params.tolist()})
-        return new_params_dict
-
-
     from datetime import datetime
     trainedAt = datetime.now()
-    ids = []
+    events = []
+    rows = []
     for event, model_params in params_dict.items():
         data_dict = dict(trainedAt=trainedAt,
                      tag=tag,
                      eventType=event,
                      baseSetDict=base_set_dict,
-                     params=ndarray_to_list_in_dict(model_params))
-        obj_id = _set_rnnrbm_params(data_dict)
-        ids.append(obj_id)
-    return ids
+                     params=encodeParams(model_params))
+        events.append(event)
+        rows.append(data_dict)
+    # ids & failures keyed by eventType, saved in batches
+    results = getStorage().saveAll("Rnnrbm", rows)
+    for event in events:
+        Rnnrbm_In_Memory.pop((tag, event), None)
+        Rnnrbm_In_Memory.pop((None, event), None)
+    return _collectSaveResults(events, results)
 
     #except Exception,e:
         #print "Exception is",e
@@ -79,51 +90,145 @@ def _set_rnnrbm_params(params):
      {"eventType":"dining_in_restaurant","tag":"latest","trainedAt":datetime.datetime.now(),"params":{"W":[],...}}
     :return:
     '''
-    model = Rnnrbm()
-    model.set(params)
-    model.save()
-    return model.id
+    return getStorage().save("Rnnrbm", params)
 
 def get_all_rnnrbm_params(tag=None, event_list=None):
+    '''
+    返回 event_list 中每个 eventType 最新的 Rnnrbm 参数
+
+    Events not in memory are fetched in one query, params are cached by (tag, eventType)
+    for MODEL_CACHE_TTL seconds and dropped when params of the event are saved here.
+
+    Parameters
+    ----------
+    tag: string, optional, None for the latest params of any tag
+    event_list: list of eventType
 
+    Returns
+    -------
+    event_params_dict: dict, keys are eventTypes, values are dict of ndarray, e.g. {"W": ndarray, "bv": ndarray, ...}
+    '''
+    now = time.time()
     event_params_dict = {}
+    missing = []
     for event in event_list:
-        params_dict = _get_rnnrbm_params(eventType=event)
-        event_params_dict.update({event:params_dict["params"]})
+        entry = Rnnrbm_In_Memory.get((tag, event))
+        if entry is not None and (MODEL_CACHE_TTL is None or now - entry['loadedAt'] <= MODEL_CACHE_TTL):
+            event_params_dict[event] = entry['params']
+        else:
+            missing.append(event)
+
+    if missing:
+        logger.debug('[get_all_rnnrbm_params] tag=%s, eventTypes=%s not in Memory' % (tag, missing))
+        rows = getStorage().getLatestRnnrbms(missing, tag)
+        not_found = [event for event in missing if event not in rows]
+        if not_found:
+            raise ValueError("tag=%s don't have Rnnrbm params of %s" % (tag, ', '.join(not_found)))
+        for event in missing:
+            params = _decodeRnnrbmParams(rows[event].get("params"))
+            Rnnrbm_In_Memory.set((tag, event), {'params': params, 'loadedAt': now})
+            event_params_dict[event] = params
 
     return event_params_dict
 
 
-def _get_rnnrbm_params(**conditions):
+def _decodeRnnrbmParams(params):
+    # Rows saved before the binary encoding hold nested lists
+    params = decodeParams(params)
+    return dict((name, value if isinstance(value, np.ndarray) else np.asarray(value, dtype=float))
+                for name, value in params.iteritems())
+
+
+def setModel(algo_type, model_tag, event_type, model_param, status_sets, timestamp, description, last_train_data=None):
     '''
+    保存 Model, last_train_data 另存为 TrainData
 
-    :param conditions:
-         {"eventType":"dining_in_restaurant","tag":"latest"}
-    :return:
+    last_train_data: list of seq of senz dict, optional, the observations the model was trained on
+    '''
+    storage = getStorage()
+    model = _newModel(algo_type, model_tag, event_type, model_param, status_sets, timestamp, description)
+    if last_train_data:
+        train_data = _newTrainData(algo_type, model_tag, event_type, last_train_data)
+        model['lastTrainDataId'] = storage.save("TrainData", train_data)
+    return storage.save("Model", model)
+
+def setModels(models):
+    '''
+    批量保存 Model, 每 BATCH_SAVE_SIZE 个一次请求
 
+    Parameters
+    ----------
+    models: list of dict
+      keyword arguments of setModel, e.g. {'algo_type': 'GMMHMM', 'model_tag': 'init_model', 'event_type': ..., ...}
+
+    Returns
+    -------
+    ids: dict, keys are eventTypes saved, values are model ids
+    failures: dict, keys are eventTypes failed to save, values are error messages
+    '''
+    storage = getStorage()
+    event_types = [model['event_type'] for model in models]
+    rows = []
+    train_datas = []
+    for model in models:
+        model = dict(model)
+        last_train_data = model.pop('last_train_data', None)
+        rows.append(_newModel(**model))
+        if last_train_data:
+            train_datas.append((rows[-1], _newTrainData(model['algo_type'], model['model_tag'],
+                                                           model['event_type'], last_train_data)))
+
+    # Train datas first, models reference them by id
+    results = storage.saveAll("TrainData", [train_data for _, train_data in train_datas])
+    for (row, _), (train_data_id, error) in zip(train_datas, results):
+        if error is None:
+            row['lastTrainDataId'] = train_data_id
+        else:
+            logger.error('[setModels] TrainData of eventType=%s failed: %s' % (row['eventType'], error))
+    return _collectSaveResults(event_types, storage.saveAll("Model", rows))
+
+def _collectSaveResults(event_types, results):
+    ids = {}
+    failures = {}
+    for event_type, (object_id, error) in zip(event_types, results):
+        if error is None:
+            ids[event_type] = object_id
+        else:
+            logger.error('[save] eventType=%s failed: %s' % (event_type, error))
+            failures[event_type] = str(error)
+    return ids, failures
+
+def _newModel(algo_type, model_tag, event_type, model_param, status_sets, timestamp, description):
+    return {
+        "algoType": algo_type,
+        "tag": model_tag,
+        "eventType": event_type,
+        # ndarrays in the params are stored as binary buffers, see dao.codec
+        "param": encodeParams(model_param),
+        "statusSets": status_sets,
+        "trainedAt": timestamp,
+        "description": description,
+    }
+
+def _newTrainData(algo_type, model_tag, event_type, observations):
+    return {
+        "algoType": algo_type,
+        "tag": model_tag,
+        "eventType": event_type,
+        # Integer encoded & compressed, see dao.codec
+        "data": encodeObservations(observations),
+    }
+
+def getTrainData(train_data_id):
     '''
-    query = Query(Rnnrbm)
-    query.equal_to("eventType",conditions["eventType"])
-    #query.equal_to("note",conditions["note"])
-    #query.equal_to("tag","latest")
-    query.descending("trainedAt")
-    rnnrbm = query.first()
-    print "rnnrbm",rnnrbm
-    return dict(params=rnnrbm.get("params"))
-
-
-def setModel(algo_type, model_tag, event_type, model_param, status_sets, timestamp, description, last_train_data=''):
-    model = Model()
-    model.set("algoType", algo_type)
-    model.set("tag", model_tag)
-    model.set("eventType", event_type)
-    model.set("param", model_param)
-    model.set("statusSets", status_sets)
-    model.set("trainedAt", timestamp)
-    model.set("description", description)
-    model.set('lastTrainData', last_train_data)
-    model.save()
-    return model.id
+    返回 Model.lastTrainDataId 指向的训练数据
+
+    Returns
+    -------
+    observations: list of seq of senz dict
+    '''
+    train_data = getStorage().get("TrainData", train_data_id)
+    return decodeObservations(train_data.get("data"))
 
 def getModelByTag(algo_type, model_tag):
     '''
@@ -141,21 +246,160 @@ def getModelByTag(algo_type, model_tag):
     recent_models_list: list
       list of model objs
     '''
-    # Try to get models from memory
-    # If not, request database
-    if algo_type not in Model_In_Memory:
-        Model_In_Memory[algo_type] = {}
+    return _getModelEntry(algo_type, model_tag, with_models=True)['models']
 
-    if model_tag not in Model_In_Memory[algo_type]:
-        Model_In_Memory[algo_type][model_tag] = _getModelByTag_from_db(algo_type, model_tag)
 
-    return Model_In_Memory[algo_type][model_tag]
+def getModelVersionByTag(algo_type, model_tag):
+    '''
+    返回指定 algo_type 和 model_tag 的 Model 的版本
+
+    The version stamp changes whenever a model is saved under the tag.
+    A tag not in memory costs a one-row query, its models are not fetched.
+    '''
+    return _getModelEntry(algo_type, model_tag, with_models=False)['version']
+
+
+def releaseModelsByTag(algo_type, model_tag):
+    '''Drop the cached model objs of `model_tag` but keep its version stamp,
+    call it once the models are held elsewhere (e.g. the param store)
+    '''
+    entry = Model_In_Memory.get((algo_type, model_tag))
+    if entry is not None:
+        entry['models'] = None
+
+
+def seedModelVersion(algo_type, model_tag, version, pinned=False):
+    '''Record the version stamp of models held elsewhere (e.g. a tag snapshot), without a query
+
+    A pinned version is never checked against the database nor evicted, until the tag is invalidated.
+    '''
+    Model_In_Memory.set((algo_type, model_tag), {'models': None, 'version': version, 'checkedAt': time.time(),
+                                                 'pinned': pinned}, pinned=pinned)
+
+
+def invalidateModelByTag(algo_type, model_tag):
+    '''Drop the cached models of `model_tag`, call it after saving a model under the tag
+    '''
+    Model_In_Memory.pop((algo_type, model_tag), None)
+    Model_Loading.pop((algo_type, model_tag), None)
+
+
+def getModelLoadStats():
+    '''
+    返回本 worker 的 model 加载统计
+
+    Returns
+    -------
+    stats: dict
+      loads: number of loads run against the db
+      coalesced: number of requests that waited on a load or classifier build already in flight instead of
+                 running their own, counted once per request
+      inFlight: number of loads running now
+    '''
+    stats = dict(Model_Load_Stats)
+    stats['inFlight'] = len(Model_Loading)
+    return stats
+
+
+def _getModelEntry(algo_type, model_tag, with_models=True):
+    '''
+    Try to get models from memory, if not, request database.
+
+    Once an entry is older than MODEL_CACHE_TTL, its version stamp is checked
+    against the database and the models are reloaded only if it changed.
+    Only one load runs per (algo_type, tag) at a time, concurrent requests
+    wait on its result and get its exception if it fails.
+    '''
+    key = (algo_type, model_tag)
+    waited = False
+    while True:
+        entry = Model_In_Memory.get(key)
+        if _isEntryUsable(entry, with_models):
+            return entry
+
+        loading = Model_Loading.get(key)
+        if loading is None:
+            break
+        if not waited:
+            # Counted once, though a request may wait on a version check and then on the models load
+            Model_Load_Stats['coalesced'] += 1
+            waited = True
+        entry = loading.get()
+        if entry['models'] is not None or not with_models:
+            return entry
+        # The load waited on only checked the version, the models are still to load
+
+    loading = AsyncResult()
+    Model_Loading[key] = loading
+    Model_Load_Stats['loads'] += 1
+    try:
+        entry = _loadModelEntry(algo_type, model_tag, entry, with_models)
+    except Exception, e:
+        loading.set_exception(e)
+        raise
+    else:
+        # The tag may have been invalidated while loading, then the entry is not cached
+        if Model_Loading.get(key) is loading:
+            Model_In_Memory.set(key, entry)
+        loading.set(entry)
+    finally:
+        if Model_Loading.get(key) is loading:
+            Model_Loading.pop(key)
+    return entry
+
+
+def _isEntryUsable(entry, with_models):
+    if entry is None or (with_models and entry['models'] is None):
+        return False
+    if entry.get('pinned'):
+        return True
+    return MODEL_CACHE_TTL is None or time.time() - entry['checkedAt'] <= MODEL_CACHE_TTL
+
+
+def _loadModelEntry(algo_type, model_tag, stale_entry=None, with_models=True):
+    now = time.time()
+    version = None
+    if stale_entry is not None:
+        if _isEntryUsable(stale_entry, False):
+            version = stale_entry['version']
+        else:
+            version = _getModelVersion_from_db(algo_type, model_tag)
+        if version != stale_entry['version']:
+            logger.debug('[_loadModelEntry] algo_type=%s, model_tag=%s MODELS in Memory are stale' % (algo_type, model_tag))
+        elif stale_entry['models'] is not None or not with_models:
+            stale_entry['checkedAt'] = now
+            return stale_entry
+
+    if not with_models:
+        if stale_entry is None:
+            version = _getModelVersion_from_db(algo_type, model_tag)
+        return {'models': None, 'version': version, 'checkedAt': now}
+
+    models = _getModelByTag_from_db(algo_type, model_tag)
+    return {'models': models, 'version': _modelVersion(models), 'checkedAt': now}
+
+
+def _modelVersion(models):
+    '''Version stamp of a tag: objectId and updatedAt of its most recently updated model
+    '''
+    if not models:
+        return None
+    newest = max(models, key=lambda model: model.updated_at)
+    return '%s@%s' % (newest.id, newest.updated_at.isoformat())
+
+
+def _getModelVersion_from_db(algo_type, model_tag):
+    newest = getStorage().getNewestModel(algo_type, model_tag)
+    return _modelVersion([newest] if newest is not None else [])
 
 
 def _getModelByTag_from_db(algo_type, model_tag):
     '''
     根据tag挑出model，如果tag下的eventType有重复的，选择最新的model.
 
+    The storage finds the newest row of each eventType from the light columns,
+    then fetches the scoring keys of those rows only.
+
     Parameters
     ----------
     algo_type: string
@@ -169,30 +413,4 @@ def _getModelByTag_from_db(algo_type, model_tag):
       list of model objs
     '''
     logger.debug('[_getModelByTag_from_db] algo_type=%s, model_tag=%s MODELS not in Memory' % (algo_type, model_tag))
-    result = Query.do_cloud_query('select * from Model where algoType="%s" and tag="%s"' % (algo_type, model_tag))
-    results = result.results
-
-    # get most recent models
-    models_label_set = set()
-    for model in results:
-        models_label_set.add(model.get('eventType'))
-
-    threads = []
-    for label in models_label_set:
-        # gevent for asyc request
-        threads.append(gevent.spawn(async_get_model_by_tag_once, algo_type, model_tag, label))
-    gevent.joinall(threads)
-
-    recent_models_list = [thread.value for thread in threads]
-
-    return recent_models_list
-
-
-def async_get_model_by_tag_once(algo_type, model_tag, label):
-    '''wrapper func for gevent
-    '''
-    result = Query.do_cloud_query('select * from Model where algoType="%s" and tag="%s" and eventType="%s" limit 1 order by -updatedAt'
-                                  % (algo_type, model_tag, label))
-    results = result.results
-    return results[0]
-
+    return getStorage().getLatestModelsByTag(algo_type, model_tag, MODEL_SCORING_KEYS)
@@ -1,3 +1,5 @@
+import os
+
 configList = [
     "log_type",
     "events_type",
@@ -5,4 +7,35 @@ configList = [
     "location_level2_type",
     "motion_type",
     "sound_level1_type"
-]
\ No newline at end of file
+]
+
+# LeanCloud returns at most 1000 rows per query
+QUERY_PAGE_SIZE = 1000
+
+# Models cached in memory per worker
+MODEL_CACHE_MAX_TAGS = 32  # (algo_type, tag) entries kept, least recently used are evicted first
+MODEL_CACHE_TTL = 5 * 60  # seconds before a cached tag's version stamp is checked against the db, None never checks
+
+# Config rows are read from an in-memory snapshot per worker
+CONFIG_SNAPSHOT_TTL = 60  # seconds before the snapshot is reloaded, None never reloads
+
+# Objects saved per LeanCloud /batch request
+BATCH_SAVE_SIZE = 50
+
+# Floating arrays of model params are stored as base64 buffers of this dtype
+PARAM_FLOAT_DTYPE = 'float32'
+
+# Where the dao layer keeps its rows, "leancloud" or "sqlite"
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'leancloud')
+SQLITE_PATH = os.environ.get('SQLITE_PATH', 'senz_analyzer.db')  # file of the sqlite backend
+
+# Behavior rows are queued and saved in batches by a writer greenlet per process
+BEHAVIOR_BATCH_SIZE = 50  # rows per save
+BEHAVIOR_FLUSH_INTERVAL = 5  # seconds a row waits at most before its batch is saved
+BEHAVIOR_QUEUE_MAX = 10000  # rows waiting at most, see BEHAVIOR_OVERFLOW
+BEHAVIOR_OVERFLOW = os.environ.get('BEHAVIOR_OVERFLOW', 'drop_oldest')  # "drop_oldest", "drop_newest" or "block"
+BEHAVIOR_RETRY_MAX = 3  # retries of the failed rows of a batch
+BEHAVIOR_RETRY_BACKOFF = 1  # seconds before the first retry, doubled on each retry
+
+# Decoded Rnnrbm params cached per worker, (tag, eventType) entries, expire after MODEL_CACHE_TTL
+RNNRBM_CACHE_MAX = 256
@@ -0,0 +1,66 @@
+__all__ = ["writeSnapshot", "readSnapshot"]
+
+from codec import encodeParams, decodeParams
+import hashlib
+import json
+import os
+import zlib
+
+MAGIC = 'SENZTAG1'
+SNAPSHOT_FORMAT = 1
+
+
+def writeSnapshot(path, header, models):
+    '''Write the models of a tag to one checksummed file
+
+    File layout: MAGIC | newline | JSON header | newline | zlib compressed JSON list of models.
+    The header gets 'format', 'models' (count), 'length' and 'sha256' of the compressed body.
+    The file is written beside `path` and renamed over it, so readers never see a partial file.
+
+    Parameters
+    ----------
+    path: string
+    header: dict, JSON-serializable, e.g. {'algoType': ..., 'tag': ..., 'version': ...}
+    models: list of dict
+      {'eventType': string, 'statusSets': dict, 'param': dict}, ndarrays of params are stored as binary buffers
+    '''
+    body = zlib.compress(json.dumps([dict(model, param=encodeParams(decodeParams(model['param'])))
+                                     for model in models]))
+    header = dict(header, format=SNAPSHOT_FORMAT, models=len(models), length=len(body),
+                  sha256=hashlib.sha256(body).hexdigest())
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC + '\n')
+        f.write(json.dumps(header) + '\n')
+        f.write(body)
+    os.rename(tmp_path, path)
+    return header
+
+
+def readSnapshot(path):
+    '''Read a file written by writeSnapshot
+
+    Raises ValueError if it is not a snapshot, is of a newer format, is truncated or fails its checksum.
+
+    Returns
+    -------
+    header: dict
+    models: list of dict, params decoded to ndarrays
+    '''
+    with open(path, 'rb') as f:
+        if f.readline().rstrip('\n') != MAGIC:
+            raise ValueError('%s is not a tag snapshot' % (path))
+        header = json.loads(f.readline())
+        body = f.read()
+    if header['format'] > SNAPSHOT_FORMAT:
+        raise ValueError('snapshot format %s of %s is newer than %s' % (header['format'], path, SNAPSHOT_FORMAT))
+    if len(body) != header['length'] or hashlib.sha256(body).hexdigest() != header['sha256']:
+        raise ValueError('snapshot %s is corrupted, checksum mismatch' % (path))
+    models = json.loads(zlib.decompress(body))
+    for model in models:
+        model['param'] = decodeParams(model['param'])
+    return header, models
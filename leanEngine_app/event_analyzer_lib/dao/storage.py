@@ -0,0 +1,370 @@
+# coding: utf-8
+
+__all__ = ["getStorage", "setStorage", "BaseStorage", "LeanCloudStorage", "SQLiteStorage", "StoredRow"]
+
+from settings import STORAGE_BACKEND, SQLITE_PATH, QUERY_PAGE_SIZE
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import uuid
+
+logger = logging.getLogger('logentries')
+# Storage of this process, created from STORAGE_BACKEND on first use
+Storage_In_Use = []
+
+
+def getStorage():
+    '''
+    返回当前使用的存储后端 (STORAGE_BACKEND: "leancloud" 或 "sqlite")
+    '''
+    if not Storage_In_Use:
+        setStorage(_newStorage(STORAGE_BACKEND))
+    return Storage_In_Use[0]
+
+
+def setStorage(storage):
+    '''Use `storage` from now on, e.g. a SQLiteStorage of a benchmark's own file
+    '''
+    del Storage_In_Use[:]
+    Storage_In_Use.append(storage)
+    return storage
+
+
+def _newStorage(backend):
+    if backend == 'leancloud':
+        return LeanCloudStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(SQLITE_PATH)
+    raise ValueError('unknown storage backend: %s' % (backend))
+
+
+class BaseStorage(object):
+    '''The storage operations the dao layer uses
+
+    A row is an object with `id`, `updated_at` and `get(key)`, like a leancloud Object.
+    Rows of a class are plain dicts of attributes when saved.
+
+    Methods
+    -------
+    getConfigs(self): {name: value} of every Config row
+    getLatestModel(self, algo_type, tag, event_type, keys): most recently updated Model row of the event, None if
+      missing, the row getLatestModelsByTag returns for the event
+    getNewestModel(self, algo_type, tag): most recently updated Model row of the tag, None if missing
+    getLatestModelsByTag(self, algo_type, tag, keys): most recently updated Model row of each event of the tag,
+      most recently updated first
+    getLatestRnnrbms(self, event_types, tag): {eventType: most recently trained Rnnrbm row}, tag None for any tag
+    get(self, class_name, object_id): the row, raises LookupError if missing
+    save(self, class_name, attrs): saves a row, returns its id
+    saveAll(self, class_name, attrs_list): saves rows, returns a list of (object_id, error) like dao.batch.saveAll
+    '''
+
+    def getConfigs(self):
+        raise NotImplementedError
+
+    def getLatestModel(self, algo_type, tag, event_type, keys=None):
+        raise NotImplementedError
+
+    def getNewestModel(self, algo_type, tag):
+        raise NotImplementedError
+
+    def getLatestModelsByTag(self, algo_type, tag, keys=None):
+        raise NotImplementedError
+
+    def getLatestRnnrbms(self, event_types, tag=None):
+        raise NotImplementedError
+
+    def get(self, class_name, object_id):
+        raise NotImplementedError
+
+    def save(self, class_name, attrs):
+        raise NotImplementedError
+
+    def saveAll(self, class_name, attrs_list):
+        raise NotImplementedError
+
+
+class LeanCloudStorage(BaseStorage):
+    '''Rows in LeanCloud, read with CQL and written with the /batch endpoint
+    '''
+
+    def __init__(self):
+        from leancloud import Object
+        self._classes = {}
+        self._Object = Object
+
+    def _class(self, class_name):
+        if class_name not in self._classes:
+            self._classes[class_name] = self._Object.extend(class_name)
+        return self._classes[class_name]
+
+    def _new(self, class_name, attrs):
+        obj = self._class(class_name)()
+        obj.set(attrs)
+        return obj
+
+    def _cloudQuery(self, cql, *pvalues):
+        from leancloud import Query
+        return Query.do_cloud_query(cql, *pvalues).results
+
+    def getConfigs(self):
+        values = {}
+        skip = 0
+        while True:
+            results = self._cloudQuery('select name, value from Config limit %d,%d' % (skip, QUERY_PAGE_SIZE))
+            for config in results:
+                values[config.get("name")] = config.get("value")
+            if len(results) < QUERY_PAGE_SIZE:
+                break
+            skip += QUERY_PAGE_SIZE
+        return values
+
+    def getLatestModel(self, algo_type, tag, event_type, keys=None):
+        from leancloud import Query
+        query = Query(self._class('Model'))
+        query.equal_to("algoType", algo_type)
+        query.equal_to("tag", tag)
+        query.equal_to("eventType", event_type)
+        query.descending("updatedAt")
+        if keys:
+            query.select(*keys)
+        return query.first()
+
+    def getNewestModel(self, algo_type, tag):
+        results = self._cloudQuery('select updatedAt from Model where algoType=? and tag=? limit 1 order by -updatedAt',
+                                   algo_type, tag)
+        return results[0] if results else None
+
+    def getLatestModelsByTag(self, algo_type, tag, keys=None):
+        # Ids of the newest row of each event first, paging through the history without the params
+        ids = {}
+        skip = 0
+        while True:
+            results = self._cloudQuery('select eventType, updatedAt from Model where algoType=? and tag=? '
+                                       'limit %d,%d order by -updatedAt' % (skip, QUERY_PAGE_SIZE), algo_type, tag)
+            for row in results:
+                ids.setdefault(row.get('eventType'), row.id)
+            if len(results) < QUERY_PAGE_SIZE:
+                break
+            skip += QUERY_PAGE_SIZE
+        if not ids:
+            return []
+        select = ', '.join(keys) if keys else '*'
+        return self._cloudQuery('select %s from Model where objectId in (%s) limit %d order by -updatedAt'
+                                % (select, ', '.join(['?'] * len(ids)), len(ids)), *ids.values())
+
+    def getLatestRnnrbms(self, event_types, tag=None):
+        where = 'eventType in (%s)' % (', '.join(['?'] * len(event_types)))
+        pvalues = list(event_types)
+        if tag is not None:
+            where += ' and tag=?'
+            pvalues.append(tag)
+        # Ids of the newest row of each event first, without the weights, paging stops once every event has one
+        ids = {}
+        skip = 0
+        while len(ids) < len(set(event_types)):
+            results = self._cloudQuery('select eventType, trainedAt from Rnnrbm where %s limit %d,%d order by -trainedAt'
+                                       % (where, skip, QUERY_PAGE_SIZE), *pvalues)
+            for row in results:
+                ids.setdefault(row.get('eventType'), row.id)
+            if len(results) < QUERY_PAGE_SIZE:
+                break
+            skip += QUERY_PAGE_SIZE
+        if not ids:
+            return {}
+        results = self._cloudQuery('select * from Rnnrbm where objectId in (%s) limit %d'
+                                   % (', '.join(['?'] * len(ids)), len(ids)), *ids.values())
+        return dict((row.get('eventType'), row) for row in results)
+
+    def get(self, class_name, object_id):
+        from leancloud import Query
+        return Query(self._class(class_name)).get(object_id)
+
+    def save(self, class_name, attrs):
+        obj = self._new(class_name, attrs)
+        obj.save()
+        return obj.id
+
+    def saveAll(self, class_name, attrs_list):
+        from batch import saveAll
+        return saveAll([self._new(class_name, attrs) for attrs in attrs_list])
+
+
+class StoredRow(object):
+    '''A row read from SQLiteStorage, with the leancloud Object accessors the dao layer uses
+    '''
+
+    def __init__(self, object_id, attributes, created_at, updated_at):
+        self.id = object_id
+        self.attributes = attributes
+        self.created_at = created_at
+        self.updated_at = updated_at
+
+    def get(self, attr):
+        return self.attributes.get(attr)
+
+    def __repr__(self):
+        return '<StoredRow %s>' % (self.id)
+
+
+class SQLiteStorage(BaseStorage):
+    '''Rows in a local SQLite file, for offline jobs, benchmarks and tests
+
+    Every class is a table of (objectId, createdAt, updatedAt, attrs as JSON) plus
+    copies of the attributes it is queried by, which are indexed.
+    '''
+
+    # Columns copied out of attrs per class, the others are only in the JSON
+    COLUMNS = {
+        'Config': ['name'],
+        'Model': ['algoType', 'tag', 'eventType', 'trainedAt'],
+        'TrainData': ['algoType', 'tag', 'eventType'],
+        'Rnnrbm': ['tag', 'eventType', 'trainedAt'],
+        'Behavior': ['eventType', 'modelId'],
+    }
+    INDEXES = {
+        'Config': [['name']],
+        'Model': [['algoType', 'tag', 'eventType', 'updatedAt'], ['algoType', 'tag', 'updatedAt']],
+        'Rnnrbm': [['eventType', 'trainedAt']],
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # A connection must not be shared with forked children
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._createTables()
+        return self._conn
+
+    def _createTables(self):
+        with self._conn:
+            for class_name, columns in self.COLUMNS.iteritems():
+                self._conn.execute('create table if not exists "%s" (objectId text primary key, createdAt text, '
+                                   'updatedAt text, %s attrs text)'
+                                   % (class_name, ''.join('"%s", ' % (column) for column in columns)))
+                for index in self.INDEXES.get(class_name, []):
+                    self._conn.execute('create index if not exists "%s_%s" on "%s" (%s)'
+                                       % (class_name, '_'.join(index), class_name,
+                                          ', '.join('"%s"' % (column) for column in index)))
+
+    def _select(self, class_name, where='', pvalues=(), order='', limit=None, keys=None):
+        sql = 'select objectId, createdAt, updatedAt, attrs from "%s"' % (class_name)
+        if where:
+            sql += ' where ' + where
+        if order:
+            sql += ' order by ' + order
+        if limit is not None:
+            sql += ' limit %d' % (limit)
+        return [self._row(row, keys) for row in self._connection().execute(sql, pvalues)]
+
+    @staticmethod
+    def _row(row, keys=None):
+        object_id, created_at, updated_at, attrs = row
+        attrs = json.loads(attrs, object_hook=_decodeDate)
+        if keys:
+            attrs = dict((key, attrs[key]) for key in keys if key in attrs)
+        return StoredRow(object_id, attrs, _parseDate(created_at), _parseDate(updated_at))
+
+    def _first(self, *args, **kwargs):
+        rows = self._select(limit=1, *args, **kwargs)
+        return rows[0] if rows else None
+
+    def getConfigs(self):
+        return dict((row.get('name'), row.get('value')) for row in self._select('Config'))
+
+    def getLatestModel(self, algo_type, tag, event_type, keys=None):
+        return self._first('Model', 'algoType=? and tag=? and eventType=?', (algo_type, tag, event_type),
+                           'updatedAt desc, rowid desc', keys=keys)
+
+    def getNewestModel(self, algo_type, tag):
+        return self._first('Model', 'algoType=? and tag=?', (algo_type, tag), 'updatedAt desc, rowid desc')
+
+    def getLatestModelsByTag(self, algo_type, tag, keys=None):
+        # Ids of the newest row of each event first, from the indexed columns without decoding attrs
+        ids = {}
+        for object_id, event_type in self._connection().execute(
+                'select objectId, eventType from Model where algoType=? and tag=? order by updatedAt desc, rowid desc',
+                (algo_type, tag)):
+            ids.setdefault(event_type, object_id)
+        if not ids:
+            return []
+        return self._select('Model', 'objectId in (%s)' % (', '.join(['?'] * len(ids))), ids.values(),
+                            'updatedAt desc, rowid desc', keys=keys)
+
+    def getLatestRnnrbms(self, event_types, tag=None):
+        rows = {}
+        for event_type in set(event_types):
+            # The newest row of each event, read first from the (eventType, trainedAt) index
+            if tag is None:
+                row = self._first('Rnnrbm', 'eventType=?', (event_type,), 'trainedAt desc, rowid desc')
+            else:
+                row = self._first('Rnnrbm', 'eventType=? and tag=?', (event_type, tag), 'trainedAt desc, rowid desc')
+            if row is not None:
+                rows[event_type] = row
+        return rows
+
+    def get(self, class_name, object_id):
+        row = self._first(class_name, 'objectId=?', (object_id,))
+        if row is None:
+            raise LookupError('%s %s not found' % (class_name, object_id))
+        return row
+
+    def save(self, class_name, attrs):
+        object_id, error = self.saveAll(class_name, [attrs])[0]
+        if error is not None:
+            raise error
+        return object_id
+
+    def saveAll(self, class_name, attrs_list):
+        conn = self._connection()
+        columns = self.COLUMNS.get(class_name, [])
+        sql = 'insert into "%s" (objectId, createdAt, updatedAt, %s attrs) values (?, ?, ?, %s ?)' % (
+            class_name, ''.join('"%s", ' % (column) for column in columns), '?, ' * len(columns))
+        results = []
+        with conn:
+            for attrs in attrs_list:
+                object_id = uuid.uuid4().hex[:24]
+                now = _formatDate(datetime.datetime.utcnow())
+                values = [_column(attrs.get(column)) for column in columns]
+                try:
+                    conn.execute(sql, [object_id, now, now] + values + [json.dumps(attrs, default=_encodeDate)])
+                except (sqlite3.Error, TypeError, ValueError), e:
+                    logger.error('[SQLiteStorage] save %s failed: %s' % (class_name, e))
+                    results.append((None, e))
+                else:
+                    results.append((object_id, None))
+        return results
+
+
+def _formatDate(value):
+    # Fixed width so that text order is time order
+    return value.strftime('%Y-%m-%dT%H:%M:%S.%f')
+
+
+def _parseDate(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f')
+
+
+def _column(value):
+    if isinstance(value, datetime.datetime):
+        return _formatDate(value)
+    return value
+
+
+def _encodeDate(value):
+    # Dates are kept as LeanCloud's Date type
+    if isinstance(value, datetime.datetime):
+        return {'__type': 'Date', 'iso': _formatDate(value)}
+    raise TypeError('%r is not JSON serializable' % (value,))
+
+
+def _decodeDate(value):
+    if value.get('__type') == 'Date' and 'iso' in value:
+        return _parseDate(value['iso'])
+    return value
@@ -0,0 +1,180 @@
+'''Param codec, tag snapshots, the Behavior queue, Model rows against SQLiteStorage on temporary files,
+and the LRU cache of the models
+
+    $ cd event_analyzer_lib/dao && python test_storage.py
+'''
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from storage import SQLiteStorage, setStorage
+from codec import encodeParams, decodeParams
+from snapshot import writeSnapshot, readSnapshot
+from behavior import BehaviorQueue
+from cache import LRUCache
+
+
+def randomParams():
+    return {
+        'hmmParams': {'nComponent': 4, 'startProb': np.random.dirichlet(np.ones(4)),
+                      'transMat': np.random.dirichlet(np.ones(4), 4)},
+        'gmmParams': {'gmms': [{'weights': np.random.rand(3), 'means': np.random.randn(3, 2)}],
+                      'covarianceType': 'diag'},
+        'nIter': 5,
+    }
+
+
+def assertParamsClose(expected, result):
+    if isinstance(expected, np.ndarray):
+        assert result.shape == expected.shape, (expected.shape, result.shape)
+        assert np.allclose(expected, result, rtol=1e-6, atol=1e-7), (expected, result)
+    elif isinstance(expected, dict):
+        assert sorted(expected) == sorted(result), (sorted(expected), sorted(result))
+        for key in expected:
+            assertParamsClose(expected[key], result[key])
+    elif isinstance(expected, list):
+        assert len(expected) == len(result), (expected, result)
+        for expected_value, value in zip(expected, result):
+            assertParamsClose(expected_value, value)
+    else:
+        assert expected == result, (expected, result)
+
+
+def assertRaises(error_class, func, *args):
+    try:
+        func(*args)
+    except error_class:
+        return
+    raise AssertionError('%s not raised' % (error_class.__name__))
+
+
+class FailingStorage(SQLiteStorage):
+    '''Fails the first `failures` saveAll calls'''
+
+    def __init__(self, path, failures):
+        SQLiteStorage.__init__(self, path)
+        self.failures = failures
+
+    def saveAll(self, class_name, attrs_list):
+        if self.failures > 0:
+            self.failures -= 1
+            return [(None, IOError('save failed'))] * len(attrs_list)
+        return SQLiteStorage.saveAll(self, class_name, attrs_list)
+
+
+def test_params_codec(directory):
+    '''Params saved in a Model row decode to the float32 rounding of the original arrays
+    '''
+    st = setStorage(SQLiteStorage(os.path.join(directory, 'codec.db')))
+    params = randomParams()
+    object_id = st.save('Model', {'algoType': 'GMMHMM', 'tag': 't', 'eventType': 'e', 'param': encodeParams(params)})
+    decoded = decodeParams(st.get('Model', object_id).get('param'))
+    assertParamsClose(params, decoded)
+    assert decoded['hmmParams']['transMat'].dtype == np.float32
+    # rows saved before the binary encoding keep their nested lists
+    assert decodeParams({'transMat': [[0.5, 0.5]]}) == {'transMat': [[0.5, 0.5]]}
+
+
+def test_snapshot(directory):
+    '''A snapshot reads back its models, and is rejected once a byte of its body is flipped
+    '''
+    path = os.path.join(directory, 'GMMHMM', 't.snapshot')
+    models = [{'eventType': 'e%d' % (i), 'statusSets': {}, 'param': encodeParams(randomParams())} for i in range(3)]
+    writeSnapshot(path, {'algoType': 'GMMHMM', 'tag': 't'}, models)
+    header, result = readSnapshot(path)
+    assert (header['tag'], header['models']) == ('t', 3), header
+    for model, read in zip(models, result):
+        assert model['eventType'] == read['eventType']
+        assertParamsClose(decodeParams(model['param']), read['param'])
+
+    with open(path, 'rb') as f:
+        data = bytearray(f.read())
+    data[-10] ^= 0xff
+    with open(path, 'wb') as f:
+        f.write(data)
+    assertRaises(ValueError, readSnapshot, path)
+
+    with open(path, 'wb') as f:
+        f.write('not a snapshot\n{}\n')
+    assertRaises(ValueError, readSnapshot, path)
+
+
+def test_behavior_overflow(directory):
+    '''A full queue drops its oldest row, or the new one with drop_newest
+    '''
+    setStorage(SQLiteStorage(os.path.join(directory, 'overflow.db')))
+    queue = BehaviorQueue(batch_size=100, flush_interval=60, max_size=3, overflow='drop_oldest')
+    for i in range(5):
+        assert queue.put({'n': i})
+    assert [row['n'] for row in queue._rows] == [2, 3, 4]
+    assert queue.stats['dropped'] == 2
+
+    queue = BehaviorQueue(batch_size=100, flush_interval=60, max_size=3, overflow='drop_newest')
+    assert [queue.put({'n': i}) for i in range(5)] == [True, True, True, False, False]
+    assert [row['n'] for row in queue._rows] == [0, 1, 2]
+
+
+def test_behavior_flush_and_retry(directory):
+    '''flush saves every queued row in batches, failed saves are retried, then dropped after retry_max
+    '''
+    st = setStorage(FailingStorage(os.path.join(directory, 'behavior.db'), failures=2))
+    queue = BehaviorQueue(batch_size=2, flush_interval=60, max_size=10, retry_max=2, retry_backoff=0)
+    for i in range(5):
+        queue.put({'eventType': 'e', 'n': i})
+    assert queue.flush() == 5
+    assert len(queue) == 0
+    assert sorted(row.get('n') for row in st._select('Behavior')) == range(5)
+    assert queue.stats == {'queued': 5, 'saved': 5, 'dropped': 0, 'failed': 0}, queue.stats
+
+    st.failures = 3
+    queue.put({'eventType': 'e', 'n': 5})
+    assert queue.flush() == 0
+    assert queue.stats['failed'] == 1
+    assert len(st._select('Behavior')) == 5
+
+
+def test_latest_model(directory):
+    '''getLatestModel and getLatestModelsByTag return the newest row of each event
+    '''
+    st = setStorage(SQLiteStorage(os.path.join(directory, 'model.db')))
+    for i in range(3):
+        for event_type in ['a', 'b']:
+            st.save('Model', {'algoType': 'GMMHMM', 'tag': 't', 'eventType': event_type, 'param': {'n': i}})
+    st.save('Model', {'algoType': 'GMMHMM', 'tag': 'other', 'eventType': 'a', 'param': {'n': 9}})
+
+    assert st.getLatestModel('GMMHMM', 't', 'a').get('param') == {'n': 2}
+    assert st.getLatestModel('GMMHMM', 't', 'missing') is None
+    rows = st.getLatestModelsByTag('GMMHMM', 't', ('eventType', 'param'))
+    assert [(row.get('eventType'), row.get('param')) for row in rows] == [('b', {'n': 2}), ('a', {'n': 2})], rows
+    assert st.getLatestModelsByTag('GMMHMM', 'missing') == []
+
+
+def test_pinned_cache(directory):
+    '''Pinned entries are never evicted nor counted against max_entries, until popped
+    '''
+    cache = LRUCache(2)
+    cache.set('pinned', 0, pinned=True)
+    for i in range(1, 5):
+        cache.set(i, i)
+    assert sorted(cache.keys()) == [3, 4, 'pinned'], cache.keys()
+    cache.set('pinned', 1)
+    cache.set(5, 5)
+    assert sorted(cache.keys()) == [4, 5, 'pinned'], cache.keys()
+    cache.pop('pinned')
+    cache.set('pinned', 2)
+    assert sorted(cache.keys()) == [5, 'pinned'], cache.keys()
+
+
+if __name__ == '__main__':
+    np.random.seed(1)
+    directory = tempfile.mkdtemp()
+    try:
+        for test in [test_params_codec, test_snapshot, test_behavior_overflow, test_behavior_flush_and_retry,
+                     test_latest_model, test_pinned_cache]:
+            test(directory)
+            print '%s ok' % (test.__name__)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,78 @@
+# coding: utf-8
+
+__all__ = ["SessionStore", "StreamSessionError"]
+
+from collections import OrderedDict
+import time
+
+
+class StreamSessionError(Exception):
+    '''The offset a client sent doesn't match the session kept by this process
+
+    Sessions live in one worker only, a request reaching another worker (or coming after the
+    session expired) finds no session. The client resends the items after `seq_length`
+    with offset=seq_length, or the whole seq with reset.
+
+    Attributes
+    ----------
+    session_id: string
+    offset: int, items of the session the client had sent before this request
+    seq_length: int, items of the session this process has scored, 0 if it has no such session
+    '''
+
+    def __init__(self, session_id, offset, seq_length):
+        Exception.__init__(self, 'session %s has %d items here, the request continues from %d'
+                           % (session_id, seq_length, offset))
+        self.session_id = session_id
+        self.offset = offset
+        self.seq_length = seq_length
+
+
+class SessionStore(object):
+    '''Bounded in-process store of streaming predict sessions
+
+    Sessions expire `ttl` seconds after their last update, and when more than
+    `max_sessions` are alive the least recently updated ones are evicted.
+
+    Attributes
+    ----------
+    ttl: int, seconds
+    max_sessions: int
+    _sessions: OrderedDict
+      keys are session ids, values are (expire_at, session), oldest update first
+    '''
+
+    def __init__(self, ttl, max_sessions):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def get(self, session_id):
+        '''Return the session of `session_id`, None if it doesn't exist or expired
+        '''
+        item = self._sessions.get(session_id)
+        if item is None:
+            return None
+        if item[0] < time.time():
+            del self._sessions[session_id]
+            return None
+        return item[1]
+
+    def set(self, session_id, session):
+        self._sessions.pop(session_id, None)
+        self._sessions[session_id] = (time.time() + self.ttl, session)
+        self._evict()
+
+    def delete(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    def _evict(self):
+        now = time.time()
+        while self._sessions:
+            session_id, (expire_at, _) = next(self._sessions.iteritems())
+            if expire_at >= now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
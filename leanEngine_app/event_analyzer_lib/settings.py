@@ -1,7 +1,27 @@
-__all__ = ["dataSource"]
+__all__ = ["dataSource", "STREAM_SESSION_TTL", "STREAM_SESSION_MAX", "MODEL_STORE_DIR", "PREDICT_CACHE_SIZE",
+           "TRAIN_POOL_SIZE", "CODEC_CACHE_MAX"]
+
+import multiprocessing
+import os
 
 dataSource = [
     "COUNTERFEIT",
     "COLLECTION",
     "SDK"
 ]
+
+# Streaming predict sessions
+STREAM_SESSION_TTL = 30 * 60  # seconds a session lives after its last update
+STREAM_SESSION_MAX = 10000  # sessions kept per worker, least recently updated are evicted first
+
+# Directory of the param store files shared by all workers on a host, empty disables the store
+MODEL_STORE_DIR = os.environ.get('MODEL_STORE_DIR', '')
+
+# Predict results cached per worker, keyed by the tag's model version and the encoded seq, 0 disables the cache
+PREDICT_CACHE_SIZE = int(os.environ.get('PREDICT_CACHE_SIZE', 10000))
+
+# Codecs shared by models with the same status sets, kept per worker, least recently used are evicted first
+CODEC_CACHE_MAX = int(os.environ.get('CODEC_CACHE_MAX', 64))
+
+# Child processes training the events of trainAll / trainRandomRnnRBM at a time, 1 trains them in the worker one by one
+TRAIN_POOL_SIZE = int(os.environ.get('TRAIN_POOL_SIZE', multiprocessing.cpu_count()))
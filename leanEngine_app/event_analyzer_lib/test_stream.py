@@ -0,0 +1,112 @@
+'''Streaming predict sessions of core.predictEventStream, on DiscreteHMM models trained into a temporary SQLite file
+
+    $ PYTHONPATH=. python event_analyzer_lib/test_stream.py
+'''
+
+import os
+import random
+import tempfile
+
+import numpy as np
+
+from event_analyzer_lib.dao import storage
+from event_analyzer_lib.algo.datasets import Dataset
+from event_analyzer_lib.algo.benchmark import EVENTS
+from event_analyzer_lib.session import StreamSessionError
+from event_analyzer_lib import core
+
+TAG = 'streamTest'
+ALGO_TYPE = 'DiscreteHMM'
+
+
+def setUpModels(path):
+    '''Config of benchmark.EVENTS and their DiscreteHMM models of TAG in the SQLite file `path`
+    '''
+    random.seed(1)
+    np.random.seed(1)
+    st = storage.setStorage(storage.SQLiteStorage(path))
+    d = Dataset()
+    active = lambda values: dict((value, {'isActive': True}) for value in values)
+    configs = {
+        'log_type': {'motion': {'selected': 'motion_type'}, 'sound': {'selected': 'sound_level1_type'},
+                     'location': {'selected': 'location_level2_type'}},
+        'motion_type': active(d.motion_type),
+        'sound_level1_type': active(d.sound_type),
+        'location_level2_type': active(d.location_type),
+        'events_type': dict((event, {'isActive': True, 'initParams': {}}) for event in EVENTS),
+        'event_prob_map': dict((event, d.event_prob_map[event]) for event in EVENTS),
+    }
+    st.saveAll('Config', [{'name': name, 'value': value} for name, value in configs.iteritems()])
+    core.initAll('init', ALGO_TYPE)
+    core.trainAll('init', TAG, 10, 30, ALGO_TYPE)
+    return d.randomSequence(EVENTS[0], 10)
+
+
+def assertSessionError(seq, offset, seq_length, session_id='s1'):
+    try:
+        core.predictEventStream(session_id, seq, TAG, ALGO_TYPE, offset=offset)
+    except StreamSessionError, e:
+        assert (e.offset, e.seq_length) == (offset, seq_length), (e.offset, e.seq_length)
+    else:
+        raise AssertionError('offset %s of session %s should be rejected' % (offset, session_id))
+
+
+def assertSameResult(expected, result):
+    assert sorted(expected) == sorted(result), (expected, result)
+    for event in expected:
+        assert np.allclose(expected[event], result[event]), (event, expected[event], result[event])
+
+
+def test_continue(seq):
+    '''A session continued with the right offsets scores like predictEvent of the whole seq
+    '''
+    core.Stream_Sessions.delete('s1')
+    assert core.predictEventStream('s1', seq[:4], TAG, ALGO_TYPE, offset=0)[1] == 4
+    result, seq_length = core.predictEventStream('s1', seq[4:], TAG, ALGO_TYPE, offset=4)
+    assert seq_length == len(seq)
+    assertSameResult(core.predictEvent(seq, TAG, ALGO_TYPE), result)
+
+
+def test_lost_session(seq):
+    '''A follow-up to a session this process doesn't hold (another worker's, or expired) is rejected
+    '''
+    assertSessionError(seq[4:], 4, 0, session_id='unknown')
+    core.predictEventStream('s1', seq[:4], TAG, ALGO_TYPE, offset=0)
+    core.Stream_Sessions.delete('s1')
+    assertSessionError(seq[4:], 4, 0)
+    # resent whole, the session starts over and scores the whole seq
+    result, seq_length = core.predictEventStream('s1', seq, TAG, ALGO_TYPE, offset=0)
+    assert seq_length == len(seq)
+    assertSameResult(core.predictEvent(seq, TAG, ALGO_TYPE), result)
+
+
+def test_offset_mismatch(seq):
+    '''An offset other than what the session has scored is rejected and leaves the session as it was
+    '''
+    core.predictEventStream('s1', seq[:4], TAG, ALGO_TYPE, offset=0)
+    assertSessionError(seq[6:], 6, 4)
+    assertSessionError(seq[2:], 2, 4)
+    result, seq_length = core.predictEventStream('s1', seq[4:], TAG, ALGO_TYPE, offset=4)
+    assert seq_length == len(seq)
+    assertSameResult(core.predictEvent(seq, TAG, ALGO_TYPE), result)
+
+
+def test_reset(seq):
+    '''reset starts the session over whatever offset is sent
+    '''
+    core.predictEventStream('s1', seq[:4], TAG, ALGO_TYPE, offset=0)
+    result, seq_length = core.predictEventStream('s1', seq, TAG, ALGO_TYPE, reset=True, offset=4)
+    assert seq_length == len(seq)
+    assertSameResult(core.predictEvent(seq, TAG, ALGO_TYPE), result)
+
+
+if __name__ == '__main__':
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    try:
+        seq = setUpModels(path)
+        for test in [test_continue, test_lost_session, test_offset_mismatch, test_reset]:
+            test(seq)
+            print '%s ok' % (test.__name__)
+    finally:
+        os.remove(path)
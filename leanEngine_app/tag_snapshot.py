@@ -0,0 +1,41 @@
+# coding: utf-8
+'''Export / check tag snapshots
+
+    python tag_snapshot.py export GMMHMM random_train /data/GMMHMM-random_train.snap
+    python tag_snapshot.py import /data/GMMHMM-random_train.snap
+
+`import` verifies the file and builds its classifier, workers load snapshots at boot from SNAPSHOT_FILES.
+'''
+
+import argparse
+import json
+import sys
+
+import leancloud
+
+from config import APP_ID, MASTER_KEY
+from event_analyzer_lib import core
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export / check tag snapshots')
+    subparsers = parser.add_subparsers(dest='command')
+    export_parser = subparsers.add_parser('export', help='write every model of a tag to a snapshot file')
+    export_parser.add_argument('algo_type', help='e.g. GMMHMM or DiscreteHMM')
+    export_parser.add_argument('tag')
+    export_parser.add_argument('path')
+    import_parser = subparsers.add_parser('import', help='verify a snapshot file and build its classifier')
+    import_parser.add_argument('path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'export':
+        leancloud.init(APP_ID, master_key=MASTER_KEY)
+        header = core.exportTag(args.algo_type, args.tag, args.path)
+    else:
+        header = core.importTag(args.path)
+    print json.dumps(header, indent=2, sort_keys=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,19 @@
 # coding: utf-8
 
+import atexit
 import os
 
 import leancloud
 #from wsgiref import simple_server
 from gevent.wsgi import WSGIServer
 
-from app import app
+from app import app, warm_up
+from event_analyzer_lib.dao.behavior import flushUserBehaviors
 from cloud import engine
 
-from config import APP_ID, MASTER_KEY
+from config import APP_ID, MASTER_KEY, PRELOAD_TARGETS, PRELOAD_IN_MASTER, SNAPSHOT_FILES, SNAPSHOT_PINNED
 
+import gevent
 from gevent import monkey
 monkey.patch_all()
 
@@ -18,6 +21,15 @@ leancloud.init(APP_ID, master_key=MASTER_KEY)
 
 application = engine
 
+# Queued Behavior rows are saved before the worker exits
+atexit.register(flushUserBehaviors)
+
+if PRELOAD_IN_MASTER:
+    # with `gunicorn --preload` this runs once in the master, forked workers start warm
+    warm_up(PRELOAD_TARGETS, SNAPSHOT_FILES, SNAPSHOT_PINNED)
+else:
+    gevent.spawn(warm_up, PRELOAD_TARGETS, SNAPSHOT_FILES, SNAPSHOT_PINNED)
+
 
 if __name__ == '__main__':
     # Be runnable locally.